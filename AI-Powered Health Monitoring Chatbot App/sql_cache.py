@@ -0,0 +1,350 @@
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+
+MONTHS = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+
+# Spellings folded together before prompts are compared for similarity
+SYNONYMS = [
+    *((rf"\b{month[:3]}(?:t)?\b", month) for month in MONTHS if month != "may"),
+    (r"\befficient\b", "efficiency"),
+    (r"\b(?:calories|kcal|energy)\b", "calorie"),
+    (r"\b(?:avg|mean)\b", "average"),
+    (r"\b(?:maximum|highest|peak)\b", "max"),
+    (r"\b(?:minimum|lowest)\b", "min"),
+    (r"\bsum\b", "total"),
+    (r"\brhr\b", "resting heart rate"),
+    (r"\bhrv\b", "heart rate variability"),
+    (r"\bhr\b", "heart rate"),
+    (r"\b(?:past|previous)\b", "last"),
+    (r"\b(?:7|seven) days\b", "week"),
+    (r"\b(?:30|thirty) days\b", "month"),
+    (r"\b(?:12 months|365 days)\b", "year"),
+]
+
+# Words that carry no meaning for the generated SQL
+STOP_WORDS = {
+    "a", "an", "the", "what", "was", "were", "is", "are", "my", "me", "i", "show", "tell", "give", "get",
+    "of", "for", "in", "on", "during", "over", "how", "did", "do", "does", "please", "can", "you", "about",
+}
+
+# Words two prompts must agree on before one reuses the other's SQL: the aggregate, the period
+# and the metric with its qualifiers (deep vs total sleep, naps, resting heart rate, ...)
+GUARD_WORDS = {
+    "average", "max", "min", "total", "count", "trend", "compare", "today", "yesterday", "tonight",
+    "day", "week", "weekend", "month", "year", "night", "last", "this", "first",
+    "sleep", "deep", "rem", "light", "nap", "awake", "disturbance", "efficiency", "respiratory",
+    "heart", "resting", "variability", "recovery", "strain", "workout", "calorie", "kilojoule",
+    "distance", "altitude", "spo2", "oxygen", "skin", "temperature", "weight", "height",
+    *MONTHS,
+}
+
+DATE_LITERAL = re.compile(r"'(\d{4}-\d{2}-\d{2})")
+# Prompts naming a year, a month or a day/month keep the dates their SQL was generated with.
+# "may" only counts next to a day number, since it is usually the verb.
+ABSOLUTE_DATE = re.compile(
+    r"\b\d{4}\b|\b\d{1,2}/\d{1,2}\b"
+    r"|\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|june?|july?|aug(?:ust)?|sep(?:t|tember)?"
+    r"|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b"
+    r"|\bmay \d{1,2}\b|\b\d{1,2}(?:st|nd|rd|th)? (?:of )?may\b"
+)
+
+
+def normalize_prompt(prompt):
+    """Lower-case, collapse whitespace and drop trailing punctuation, so trivial variations share a key."""
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip(" ?.!")
+
+
+def schema_hash(schema_text):
+    """Hash of the schema description sent with the prompt; a schema change invalidates every cached query."""
+    return hashlib.sha256(schema_text.encode("utf-8")).hexdigest()
+
+
+def cache_key(prompt, schema_text):
+    return hashlib.sha256(f"{schema_hash(schema_text)}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+def canonical_prompt(prompt):
+    """Normalized prompt with synonyms folded, stop words dropped and plurals singularized, for similarity."""
+    text = re.sub(r"[^a-z0-9/ ]+", " ", re.sub(r"'s\b", "", normalize_prompt(prompt)))
+    for pattern, replacement in SYNONYMS:
+        text = re.sub(pattern, replacement, text)
+    words = [re.sub(r"(?<=[a-z]{2}[^sui])s$", "", word) for word in text.split() if word not in STOP_WORDS]
+    return " ".join(words)
+
+
+def prompt_guard(canonical):
+    """Numbers, aggregates and periods in a canonical prompt; prompts that differ here never share SQL."""
+    words = canonical.split()
+    return (
+        tuple(sorted(word for word in words if any(ch.isdigit() for ch in word))),
+        frozenset(word for word in words if word in GUARD_WORDS),
+    )
+
+
+def rebind_dates(sql, generated_on, today):
+    """
+    Shift every 'YYYY-MM-DD' literal by the days since the SQL was generated, so the
+    dates Claude resolved for "last week" move with the calendar.
+    """
+    shift = today - generated_on
+    if not shift.days:
+        return sql
+
+    def replace(match):
+        try:
+            value = date.fromisoformat(match.group(1))
+        except ValueError:
+            return match.group(0)
+        return "'" + (value + shift).isoformat()
+    return DATE_LITERAL.sub(replace, sql)
+
+
+class SimilarPromptIndex:
+    """Character n-gram TF-IDF vectors of earlier prompts, searched by cosine similarity."""
+
+    def __init__(self, entries, ngram_range=(3, 5)):
+        # entries are (prompt, payload) pairs; payload is returned for the nearest prompt
+        self.ngram_range = ngram_range
+        self._entries = []
+        counts = []
+        for prompt, payload in entries:
+            canonical = canonical_prompt(prompt)
+            self._entries.append((prompt_guard(canonical), payload))
+            counts.append(self._ngrams(canonical))
+        document_frequency = Counter(gram for grams in counts for gram in grams)
+        total = len(counts)
+        self._idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+        # Grams never seen in the index get the highest idf, so unknown words lower the similarity
+        self._unseen_idf = math.log(1 + total) + 1
+        self._vectors = [self._vector(grams) for grams in counts]
+
+    def _ngrams(self, text):
+        grams = Counter()
+        for word in text.split():
+            padded = f" {word} "
+            for size in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for start in range(max(len(padded) - size + 1, 1)):
+                    grams[padded[start:start + size]] += 1
+        return grams
+
+    def _vector(self, grams):
+        vector = {gram: (1 + math.log(count)) * self._idf.get(gram, self._unseen_idf) for gram, count in grams.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {gram: value / norm for gram, value in vector.items()}
+
+    def nearest(self, prompt):
+        """(similarity, payload) of the closest indexed prompt that agrees on numbers, aggregates and periods."""
+        canonical = canonical_prompt(prompt)
+        guard = prompt_guard(canonical)
+        query = self._vector(self._ngrams(canonical))
+        best = (0.0, None)
+        for (entry_guard, payload), vector in zip(self._entries, self._vectors):
+            if entry_guard != guard:
+                continue
+            score = sum(value * vector.get(gram, 0.0) for gram, value in query.items())
+            if score > best[0]:
+                best = (score, payload)
+        return best
+
+
+class SQLiteCacheBackend:
+    """
+    Cache entries in a SQLite file, shared by every process (and replica) that mounts it.
+
+    A backend stores {key: (prompt, sql)} with created/last-used times and persistent
+    hit/miss counters. Another store (e.g. Redis) can replace it by providing the same
+    get/put/delete/evict/counts methods.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    key TEXT PRIMARY KEY,
+                    prompt TEXT NOT NULL,
+                    schema_hash TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_last_used_idx ON sql_cache (last_used_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sql_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared across threads, and Streamlit runs sessions on several
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def get(self, key, now, ttl_seconds):
+        """Return (sql, created_at) stored for a key that is not older than ttl_seconds, and mark it used."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sql, created_at FROM sql_cache WHERE key = ? AND created_at >= ?", (key, now - ttl_seconds)
+            ).fetchone()
+            if row is not None:
+                self.touch(key, now)
+            return row
+
+    def touch(self, key, now):
+        with self._connect() as conn:
+            conn.execute("UPDATE sql_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+
+    def entries(self, schema_hash, now, ttl_seconds):
+        """(key, prompt, sql, created_at) of every live entry written for a schema."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT key, prompt, sql, created_at FROM sql_cache WHERE schema_hash = ? AND created_at >= ?",
+                (schema_hash, now - ttl_seconds)
+            ).fetchall()
+
+    def put(self, key, prompt, schema_hash, sql, now):
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO sql_cache (key, prompt, schema_hash, sql, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET sql = excluded.sql, created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+            """, (key, prompt, schema_hash, sql, now, now))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+
+    def evict(self, now, ttl_seconds, max_entries):
+        """Drop expired entries, then the least recently used ones beyond max_entries. Returns how many went."""
+        with self._connect() as conn:
+            expired = conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - ttl_seconds,)).rowcount
+            overflow = conn.execute("""
+                DELETE FROM sql_cache WHERE key IN (
+                    SELECT key FROM sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_entries,)).rowcount
+            return expired + overflow
+
+    def count(self, name, amount=1):
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO sql_cache_stats (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+            """, (name, amount))
+
+    def counts(self):
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM sql_cache_stats").fetchall())
+            counters["entries"] = conn.execute("SELECT count(*) FROM sql_cache").fetchone()[0]
+            return counters
+
+
+class PromptSQLCache:
+    """
+    Persistent prompt -> SQL cache in front of parse_intent.
+
+    Keys combine the normalized prompt with a hash of the schema text, so entries survive
+    restarts and are shared across replicas but never outlive the schema they were written
+    for. Entries expire after ttl_seconds and the least recently used ones are evicted
+    beyond max_entries.
+
+    With a similarity_threshold, a prompt with no exact entry reuses the SQL of the most
+    similar earlier prompt (character n-gram TF-IDF cosine) when it scores at least the
+    threshold. Date literals are shifted to today in both cases, unless the prompt named
+    an absolute date.
+    """
+
+    def __init__(self, backend, ttl_seconds=30 * 24 * 3600, max_entries=5000, similarity_threshold=None,
+                 index_refresh_seconds=60):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        # Entries written by other processes join the similarity index after at most this long
+        self.index_refresh_seconds = index_refresh_seconds
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, schema_key, now):
+        with self._lock:
+            built_at, index = self._indexes.get(schema_key, (0, None))
+            if index is None or now - built_at > self.index_refresh_seconds:
+                entries = self.backend.entries(schema_key, now, self.ttl_seconds)
+                index = SimilarPromptIndex((prompt, (key, prompt, sql, created_at)) for key, prompt, sql, created_at in entries)
+                self._indexes[schema_key] = (now, index)
+            return index
+
+    def lookup(self, prompt, schema_text, today=None):
+        """
+        Return (sql, match, key): match is "exact", "similar" or None on a miss, and key
+        identifies the entry the SQL came from, for invalidate() when that SQL fails.
+        """
+        now = time.time()
+        today = today or date.today()
+        key = cache_key(prompt, schema_text)
+        row = self.backend.get(key, now, self.ttl_seconds)
+        if row is not None:
+            self.backend.count("hits")
+            return self._rebind(row[0], prompt, row[1], today), "exact", key
+
+        if self.similarity_threshold is not None:
+            score, entry = self._index(schema_hash(schema_text), now).nearest(prompt)
+            if entry is not None and score >= self.similarity_threshold:
+                key, source_prompt, sql, created_at = entry
+                self.backend.touch(key, now)
+                self.backend.count("similar_hits")
+                return self._rebind(sql, source_prompt, created_at, today), "similar", key
+
+        self.backend.count("misses")
+        return None, None, None
+
+    @staticmethod
+    def _rebind(sql, prompt, created_at, today):
+        if ABSOLUTE_DATE.search(normalize_prompt(prompt)):
+            return sql
+        return rebind_dates(sql, datetime.fromtimestamp(created_at).date(), today)
+
+    def get(self, prompt, schema_text):
+        return self.lookup(prompt, schema_text)[0]
+
+    def put(self, prompt, schema_text, sql):
+        now = time.time()
+        schema_key = schema_hash(schema_text)
+        self.backend.put(cache_key(prompt, schema_text), normalize_prompt(prompt), schema_key, sql, now)
+        evicted = self.backend.evict(now, self.ttl_seconds, self.max_entries)
+        if evicted:
+            self.backend.count("evictions", evicted)
+        with self._lock:
+            self._indexes.pop(schema_key, None)
+
+    def invalidate(self, key):
+        """Forget the entry a lookup returned, e.g. when its SQL no longer runs."""
+        self.backend.delete(key)
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self):
+        """Hits, similar hits, misses, evictions and entries across every process using the backend, plus the hit rate."""
+        counters = self.backend.counts()
+        hits, similar_hits, misses = counters.get("hits", 0), counters.get("similar_hits", 0), counters.get("misses", 0)
+        lookups = hits + similar_hits + misses
+        return {
+            "hits": hits,
+            "similar_hits": similar_hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "entries": counters["entries"],
+            "hit_rate": round((hits + similar_hits) / lookups, 3) if lookups else None,
+        }
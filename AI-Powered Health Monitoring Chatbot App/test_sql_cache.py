@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from sql_cache import PromptSQLCache, SQLiteCacheBackend
+
+SCHEMA = "PostgreSQL\nschema"
+
+
+class PromptSQLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = PromptSQLCache(
+            SQLiteCacheBackend(os.path.join(self.directory.name, "cache.sqlite3")), similarity_threshold=0.85
+        )
+
+    def test_failing_similar_hit_evicts_its_source_entry(self):
+        self.cache.put("what was my average heart rate last week", SCHEMA, "SELECT broken")
+
+        sql, match, key = self.cache.lookup("avg HR last 7 days", SCHEMA)
+        self.assertEqual((sql, match), ("SELECT broken", "similar"))
+
+        # What fetch_data does when the reused SQL fails
+        self.cache.invalidate(key)
+
+        self.assertEqual(self.cache.lookup("average heart rate over the past week", SCHEMA), (None, None, None))
+        self.assertEqual(self.cache.lookup("what was my average heart rate last week", SCHEMA), (None, None, None))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_paraphrase_reuses_sql(self):
+        self.cache.put("what was my average heart rate last week", SCHEMA, "SELECT hr")
+
+        self.assertEqual(self.cache.lookup("avg HR last 7 days", SCHEMA)[:2], ("SELECT hr", "similar"))
+
+    def test_qualifier_words_are_not_reused_across_meanings(self):
+        for prompt in STORED_PROMPTS:
+            self.cache.put(prompt, SCHEMA, f"SELECT '{prompt}'")
+
+        self.assertEqual(self.cache.lookup("show my sleep efficiency last week for naps", SCHEMA)[:2], (None, None))
+        self.assertEqual(self.cache.lookup("how many calories did I burn last week", SCHEMA)[:2], (None, None))
+
+    def test_deep_sleep_does_not_reuse_total_sleep(self):
+        self.cache.put("average sleep last week", SCHEMA, "SELECT total")
+
+        self.assertEqual(self.cache.lookup("average deep sleep last week", SCHEMA)[:2], (None, None))
+
+    def test_month_names_are_guarded(self):
+        self.cache.put("average sleep in march", SCHEMA, "SELECT march")
+
+        self.assertEqual(self.cache.lookup("average sleep in may", SCHEMA)[:2], (None, None))
+        self.assertEqual(self.cache.lookup("average sleep in mar", SCHEMA)[:2], ("SELECT march", "similar"))
+
+    def test_relative_dates_shift_when_a_word_starts_like_a_month(self):
+        week_start = date.today() - timedelta(days=7)
+        self.cache.put("did my heart rate decrease last week", SCHEMA, f"SELECT * WHERE day >= '{week_start}'")
+
+        later = date.today() + timedelta(days=10)
+        sql, match, _ = self.cache.lookup("did my heart rate decrease last week", SCHEMA, today=later)
+        self.assertEqual((sql, match), (f"SELECT * WHERE day >= '{week_start + timedelta(days=10)}'", "exact"))
+
+    def test_named_months_keep_their_dates(self):
+        self.cache.put("average sleep in march 2026", SCHEMA, "SELECT * WHERE day >= '2026-03-01'")
+
+        later = date.today() + timedelta(days=10)
+        self.assertEqual(self.cache.lookup("average sleep in march 2026", SCHEMA, today=later)[0],
+                         "SELECT * WHERE day >= '2026-03-01'")
+
+
+STORED_PROMPTS = [
+    "what was my average heart rate last week", "average sleep time last week", "max strain last month",
+    "show my recovery score trend this month", "how many workouts did I do last week", "average hrv last 30 days",
+    "total deep sleep last week", "average strain last week", "my resting heart rate yesterday",
+    "show my sleep efficiency last week",
+]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_accounts(path, default_username=None, default_password=None):
+    """
+    Read the accounts to ingest from a JSON file: [{"username": ..., "password": ...}, ...].
+    Falls back to the single default account when the file does not exist.
+    """
+    if not os.path.exists(path):
+        return [{"username": default_username, "password": default_password}]
+    with open(path, "r", encoding="utf-8") as accounts_file:
+        accounts = json.load(accounts_file)
+    logging.info(f"Loaded {len(accounts)} accounts from {path}")
+    return accounts
+
+
+def ingest_accounts(accounts, client_factory, ingest, database, max_workers=4):
+    """
+    Run one ingest pipeline per account on a bounded worker pool.
+
+    client_factory(username, password) builds an authenticated client and
+    ingest(client, database) fetches and stores its data, returning record counts.
+    Every account shares the same database pool, and a failing account never stops
+    the others. Returns one result dict per account, in input order.
+    """
+    def run_account(account):
+        username = account.get("username")
+        started = time.perf_counter()
+        result = {"username": username, "user_id": None, "status": "ok", "records": {}, "error": None}
+        try:
+            client = client_factory(username, account.get("password"))
+            result["user_id"] = client.user_id
+            result["records"] = ingest(client, database) or {}
+        except Exception as e:
+            logging.error(f"Ingest failed for account {username}: {e}")
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        logging.info(
+            f"Account {username} (user {result['user_id']}): {result['status']} in "
+            f"{result['seconds']}s, records {result['records']}"
+        )
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(run_account, accounts))
+
+    failed = sum(1 for result in results if result["status"] != "ok")
+    logging.info(
+        f"Ingested {len(results) - failed}/{len(results)} accounts with {max_workers} workers "
+        f"in {time.perf_counter() - started:.3f}s"
+    )
+    return results
@@ -0,0 +1,202 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+
+from whoop_backfill import backfill
+from whoop_db import BulkWriter, IngestDatabase
+from whoop_mock_server import MockWhoopServer, parse_args as mock_args, settings_from_args
+from whoop_pipeline import STORE_METHODS, stream_collections
+from whoop_rate_limit import AdaptiveRateLimiter
+from whoop_schema import migrate
+
+# The ingest script whose WhoopClient is benchmarked
+CLIENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "whoop_fetch_and_store(For cloud Deployement).py")
+
+MODES = ("range", "stream", "backfill")
+
+
+def load_client_class():
+    """Import WhoopClient from the ingest script (its file name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("whoop_fetch_and_store", CLIENT_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.WhoopClient
+
+
+class CountingWriter(BulkWriter):
+    """BulkWriter that counts write calls and rows; with dry_run=True nothing reaches a database."""
+
+    def __init__(self, dry_run=False, **kwargs):
+        super().__init__(**kwargs)
+        self.dry_run = dry_run
+        self.writes = 0
+        self.rows = 0
+        self._counter_lock = threading.Lock()
+
+    def write(self, conn, table, rows):
+        rows = list(rows)
+        with self._counter_lock:
+            self.writes += 1
+            self.rows += len(rows)
+        if self.dry_run:
+            return {"table": table.name, "mode": "dry_run", "rows": len(rows)}
+        return super().write(conn, table, rows)
+
+
+class NullCursor:
+    """Cursor that accepts and ignores statements, e.g. the savepoints around each batch."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, *args, **kwargs):
+        pass
+
+    def executemany(self, *args, **kwargs):
+        pass
+
+
+class NullConnection:
+    def cursor(self):
+        return NullCursor()
+
+
+class NullDatabase:
+    """Stands in for IngestDatabase when the benchmark runs without PostgreSQL."""
+
+    @contextmanager
+    def connection(self):
+        yield NullConnection()
+
+    @contextmanager
+    def run(self):
+        yield self
+
+    def stats(self):
+        return {}
+
+
+def run_mode(mode, client, store_db, start_date, end_date, args):
+    """Fetch and store one account with the given strategy. Returns records per collection."""
+    if mode == "range":
+        collections = client.get_collections(start_date, end_date, max_workers=args.fetch_concurrency)
+        for name, records in collections.items():
+            if records:
+                getattr(client, STORE_METHODS[name])(records, store_db)
+        return {name: len(records) for name, records in collections.items()}
+    if mode == "stream":
+        return stream_collections(
+            client, store_db, start_date=start_date, end_date=end_date,
+            max_workers=args.fetch_concurrency, queue_size=args.queue_size
+        )
+    return backfill(
+        client, store_db, start_date, end_date, shard_days=args.shard_days,
+        max_workers=args.backfill_workers, queue_size=args.queue_size
+    )
+
+
+def benchmark(mode, client_class, server, database, args):
+    """Run one mode against the mock server and measure throughput, peak memory and database writes."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown benchmark mode: {mode}")
+
+    class MockClient(client_class):
+        AUTH_URL = server.base_url
+        REQUEST_URL = f"{server.base_url}/developer"
+
+    writer = CountingWriter(dry_run=database is None, upsert=args.upsert)
+    store_db = database or NullDatabase()
+    settings = server.settings
+    start_date = settings.first_date.isoformat()
+    end_date = (settings.end_date + timedelta(days=1)).isoformat()
+    requests_before = server.stats["requests"]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    client = MockClient(
+        "benchmark@example.com", "benchmark",
+        rate_limiter=AdaptiveRateLimiter(args.requests_per_second, burst=args.requests_per_second),
+        bulk_writer=writer,
+    )
+    with store_db.run() as run_db:
+        counts = run_mode(mode, client, run_db, start_date, end_date, args)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    records = sum(counts.values())
+    return {
+        "mode": mode,
+        "records": records,
+        "seconds": round(seconds, 3),
+        "records_per_sec": round(records / seconds, 1) if seconds else None,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+        "http_requests": server.stats["requests"] - requests_before,
+        "throttled": client.rate_limiter.throttled,
+        "db_writes": writer.writes,
+        "rows_written": writer.rows,
+        "records_per_collection": counts,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the WHOOP ingest against the local mock API.")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--db-config", help="JSON file with psycopg2 connection settings; omit to skip database writes")
+    parser.add_argument("--upsert", action="store_true", help="write with BulkWriter(upsert=True)")
+    parser.add_argument("--requests-per-second", type=float, default=200.0)
+    parser.add_argument("--fetch-concurrency", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--shard-days", type=int, default=30)
+    parser.add_argument("--backfill-workers", type=int, default=8)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args, mock_argv = parser.parse_known_args(argv)
+    # Remaining options (--days, --latency-ms, --throttle-rate, ...) shape the mock API
+    return args, mock_args(mock_argv)
+
+
+def main(argv=None):
+    args, server_args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    client_class = load_client_class()
+    # Per-request access logs from the mock server would dominate the output
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    database = None
+    if args.db_config:
+        with open(args.db_config, "r", encoding="utf-8") as config_file:
+            database = IngestDatabase(json.load(config_file), maxconn=max(4, args.backfill_workers))
+        migrate(database)
+
+    results = []
+    with MockWhoopServer(settings_from_args(server_args), port=0) as server:
+        for mode in args.modes.split(","):
+            result = benchmark(mode.strip(), client_class, server, database, args)
+            results.append(result)
+            print(
+                f"{result['mode']:>8}: {result['records']} records in {result['seconds']}s "
+                f"({result['records_per_sec']} rec/s), peak {result['peak_memory_mb']} MB, "
+                f"{result['http_requests']} requests, {result['throttled']} throttled, "
+                f"{result['db_writes']} writes / {result['rows_written']} rows"
+            )
+    if database is not None:
+        database.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
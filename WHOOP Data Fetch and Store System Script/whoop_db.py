@@ -0,0 +1,410 @@
+import hashlib
+import io
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class TableSpec:
+    """Describes a WHOOP table: its columns, the key used to skip duplicates and how rows are upserted."""
+
+    HASH_COLUMN = "content_hash"  # md5 of the stored values, used by upserts to detect real changes
+
+    def __init__(self, name, columns, conflict_columns=None, version_column=None, time_column=None):
+        self.name = name
+        self.columns = list(columns)
+        self.conflict_columns = list(conflict_columns or [])
+        # Column holding the API's updated_at, if the table stores it; older versions never overwrite newer ones
+        self.version_column = version_column
+        # Column the table is range-partitioned on by month (see whoop_schema); part of every unique key
+        self.time_column = time_column
+
+    @property
+    def can_upsert(self):
+        """Upserts need a key to conflict on."""
+        return bool(self.conflict_columns)
+
+    def conflict_clause(self, upsert=False):
+        """Build the ON CONFLICT clause used when merging rows into the table."""
+        if not self.conflict_columns:
+            return sql.SQL("ON CONFLICT DO NOTHING")
+        target = sql.SQL(", ").join(map(sql.Identifier, self.conflict_columns))
+        if not upsert:
+            return sql.SQL("ON CONFLICT ({}) DO NOTHING").format(target)
+
+        table = sql.Identifier(self.name)
+        hash_column = sql.Identifier(self.HASH_COLUMN)
+        updates = [
+            sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(column), sql.Identifier(column))
+            for column in self.columns + [self.HASH_COLUMN]
+            if column not in self.conflict_columns
+        ]
+        # Only rewrite rows whose content changed, and never with an older version
+        condition = sql.SQL("{}.{} IS DISTINCT FROM EXCLUDED.{}").format(table, hash_column, hash_column)
+        if self.version_column:
+            version = sql.Identifier(self.version_column)
+            condition = sql.SQL("{} AND ({}.{} IS NULL OR EXCLUDED.{} >= {}.{})").format(
+                condition, table, version, version, table, version
+            )
+        return sql.SQL("ON CONFLICT ({}) DO UPDATE SET {} WHERE {}").format(
+            target, sql.SQL(", ").join(updates), condition
+        )
+
+    def key_of(self, row):
+        """Conflict key values of a row laid out in self.columns order."""
+        return tuple(row[self.columns.index(column)] for column in self.conflict_columns)
+
+
+def content_hash(row):
+    """Stable md5 of a row's values, stored alongside upserted rows."""
+    return hashlib.md5(json.dumps(list(row), default=str).encode("utf-8")).hexdigest()
+
+
+# Target tables written by the WhoopClient store_* methods. Unique keys include the partition
+# column because PostgreSQL only enforces uniqueness per partition.
+CYCLE_DATA = TableSpec(
+    "cycle_data",
+    ["cycle_id", "user_id", "strain", "kilojoule", "average_heart_rate", "max_heart_rate", "created_at"],
+    conflict_columns=["cycle_id", "created_at"],
+    time_column="created_at",
+)
+
+RECOVERY_DATA = TableSpec(
+    "recovery_data",
+    ["cycle_id", "sleep_id", "user_id", "score_state", "recovery_score", "resting_heart_rate",
+     "hrv_rmssd_milli", "spo2_percentage", "skin_temp_celsius", "created_at", "updated_at"],
+    conflict_columns=["cycle_id", "created_at"],
+    version_column="updated_at",
+    time_column="created_at",
+)
+
+SLEEP_DATA = TableSpec(
+    "sleep_data",
+    ["sleep_id", "user_id", "total_sleep_time", "rem_sleep_time", "deep_sleep_time", "efficiency",
+     "timestamp", "disturbance_count", "light_sleep_time", "nap", "respiratory_rate"],
+    conflict_columns=["user_id", "timestamp"],
+    time_column="timestamp",
+)
+
+WORKOUT_DATA = TableSpec(
+    "workout_data",
+    ["workout_id", "user_id", "start", "end_time", "strain", "kilojoule", "average_heart_rate",
+     "max_heart_rate", "percent_recorded", "distance_meter", "altitude_gain_meter",
+     "altitude_change_meter", "created_at"],
+    conflict_columns=["workout_id", "start"],
+    time_column="start",
+)
+
+COLLECTION_TABLES = [CYCLE_DATA, RECOVERY_DATA, SLEEP_DATA, WORKOUT_DATA]
+
+
+def _copy_value(value):
+    """Render a single value in PostgreSQL COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class BulkWriter:
+    """
+    Write batches of rows with as few server round trips as possible.
+
+    Small batches go through a multi-row INSERT ... VALUES statement. Large batches
+    are streamed with COPY into a temporary staging table and merged into the target
+    table with a single INSERT ... SELECT.
+
+    With upsert=True, rows of keyed tables carry a content hash. Rows whose stored hash
+    already matches are dropped before they are sent, and the remaining ones update
+    the existing row only when its content changed and the incoming version is not older.
+    """
+
+    COPY_THRESHOLD = 1000  # Batches at least this large use the COPY path
+    PAGE_SIZE = 500  # Rows per multi-row VALUES statement
+
+    def __init__(self, copy_threshold=COPY_THRESHOLD, page_size=PAGE_SIZE, upsert=False, metrics=None):
+        self.copy_threshold = copy_threshold
+        self.page_size = page_size
+        self.upsert = upsert
+        # Optional MetricsRegistry that receives rows written, rows skipped and write times per table
+        self.metrics = metrics
+
+    def choose_mode(self, row_count):
+        """Pick the load path for a batch of the given size."""
+        return "copy" if row_count >= self.copy_threshold else "values"
+
+    def write(self, conn, table, rows):
+        """Load rows into the table on an open connection. The caller commits."""
+        rows = list(rows)
+        upsert = self.upsert and table.can_upsert
+        columns = table.columns + [table.HASH_COLUMN] if upsert else table.columns
+        skipped = 0
+        started = time.perf_counter()
+
+        with conn.cursor() as cursor:
+            if upsert and rows:
+                rows = self._latest_per_key(table, rows)
+                rows = [row + (content_hash(row),) for row in rows]
+                before = len(rows)
+                rows = self._drop_unchanged(cursor, table, rows)
+                skipped = before - len(rows)
+
+            mode = self.choose_mode(len(rows))
+            if rows:
+                conflict = table.conflict_clause(upsert)
+                if mode == "copy":
+                    self._write_copy(cursor, table, columns, conflict, rows)
+                else:
+                    self._write_values(cursor, table, columns, conflict, rows)
+
+        elapsed = time.perf_counter() - started
+        rows_per_sec = len(rows) / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Bulk wrote {len(rows)} rows to {table.name} via {mode} "
+            f"in {elapsed:.3f}s ({rows_per_sec:.0f} rows/sec)"
+            + (f", skipped {skipped} unchanged" if upsert else "")
+        )
+        result = {
+            "table": table.name,
+            "mode": mode,
+            "rows": len(rows),
+            "skipped_unchanged": skipped,
+            "seconds": elapsed,
+            "rows_per_sec": rows_per_sec,
+        }
+        if self.metrics is not None:
+            self.metrics.record_write(result)
+        return result
+
+    @staticmethod
+    def _latest_per_key(table, rows):
+        """Keep one row per key (the last one); ON CONFLICT DO UPDATE cannot touch a row twice."""
+        latest = {}
+        for row in rows:
+            latest[table.key_of(row)] = row
+        return list(latest.values())
+
+    @staticmethod
+    def _drop_unchanged(cursor, table, rows):
+        """Drop rows whose stored content hash already matches, with one lookup per batch."""
+        key_columns = sql.SQL(", ").join(map(sql.Identifier, table.conflict_columns))
+        # Keys go over as untyped literals so they compare against VARCHAR and TIMESTAMP keys alike
+        keys = tuple(
+            tuple(None if value is None else str(value) for value in table.key_of(row))
+            for row in rows
+        )
+        cursor.execute(
+            sql.SQL("SELECT {} FROM {} WHERE ({}) IN %s").format(
+                sql.Identifier(table.HASH_COLUMN), sql.Identifier(table.name), key_columns
+            ),
+            (keys,)
+        )
+        # The hash covers the key columns too, so a matching hash means the same row with the same content
+        stored = {found[0] for found in cursor.fetchall()}
+        return [row for row in rows if row[-1] not in stored]
+
+    def _write_values(self, cursor, table, columns, conflict, rows):
+        """Insert rows with multi-row VALUES statements."""
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s {}").format(
+            sql.Identifier(table.name),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+            conflict,
+        )
+        execute_values(cursor, query.as_string(cursor), rows, page_size=self.page_size)
+
+    def _write_copy(self, cursor, table, columns, conflict, rows):
+        """COPY rows into a temporary staging table, then merge them in one statement."""
+        staging = sql.Identifier(f"{table.name}_staging")
+        column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+
+        cursor.execute(sql.SQL(
+            "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ).format(staging, sql.Identifier(table.name)))
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(_copy_value(value) for value in row))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor.copy_expert(
+            sql.SQL("COPY {} ({}) FROM STDIN").format(staging, column_list).as_string(cursor),
+            buffer,
+        )
+
+        cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} {}").format(
+            sql.Identifier(table.name), column_list, column_list, staging, conflict
+        ))
+        # Drop the staging table right away so a later batch in the same transaction can reuse the name
+        cursor.execute(sql.SQL("DROP TABLE {}").format(staging))
+
+
+class _CountingPool(ThreadedConnectionPool):
+    """Threaded pool that counts how many physical connections it opened."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.handshakes = 0
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        self.handshakes += 1
+        return super()._connect(key)
+
+
+class IngestDatabase:
+    """
+    Pool of PostgreSQL connections shared by the store_* methods.
+
+    Create one per ingest run (or one for the Flask app) and pass it wherever a
+    db_config dict used to go. Transaction modes:
+      - "table": every store_* call (one page or batch of records) borrows a connection
+                 and commits on its own, so a run commits page by page.
+      - "run":   run() pins one connection and commits everything at the end, so a
+                 failed run leaves no table partly written.
+    """
+
+    TRANSACTION_MODES = ("table", "run")
+
+    def __init__(self, db_config, minconn=1, maxconn=4, transaction="table"):
+        if transaction not in self.TRANSACTION_MODES:
+            raise ValueError(f"Unknown transaction mode: {transaction}")
+        self.transaction = transaction
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = _CountingPool(minconn, maxconn, **db_config)
+        # ThreadedConnectionPool raises when exhausted, so block on free slots instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._borrows = 0
+        self._wait_seconds = 0.0
+
+    def acquire(self):
+        """Borrow a raw connection from the pool, waiting for a free slot if needed."""
+        started = time.perf_counter()
+        self._slots.acquire()
+        waited = time.perf_counter() - started
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self._in_use += 1
+            self._borrows += 1
+            self._wait_seconds += waited
+        return conn
+
+    def release(self, conn):
+        """Return a connection obtained from acquire()."""
+        self._pool.putconn(conn)
+        with self._stats_lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for one unit of work and commit it on success."""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def run(self):
+        """
+        Scope an ingest run. Yields the object to pass to the store_* methods:
+        the database itself in "table" mode, or a single shared transaction in "run" mode.
+        """
+        if self.transaction == "table":
+            yield self
+            return
+
+        conn = self.acquire()
+        run = _RunTransaction(conn)
+        try:
+            yield run
+            if run.failed:
+                raise RuntimeError("A store step failed; the ingest run was rolled back.")
+            conn.commit()
+            logging.info("Ingest run committed as a single transaction.")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """Pool size, physical handshakes and time spent waiting for a connection."""
+        with self._stats_lock:
+            return {
+                "pool_min": self.minconn,
+                "pool_max": self.maxconn,
+                "in_use": self._in_use,
+                "handshakes": self._pool.handshakes,
+                "borrows": self._borrows,
+                "wait_seconds": round(self._wait_seconds, 6),
+            }
+
+    def close(self):
+        """Close every pooled connection."""
+        self._pool.closeall()
+
+
+class _RunTransaction:
+    """One pinned connection shared by every store_* call of a run-mode ingest."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.failed = False
+
+    @contextmanager
+    def connection(self):
+        """Hand out the pinned connection; nothing is committed until the run ends."""
+        with self._lock:
+            try:
+                yield self._conn
+            except Exception:
+                # The server-side transaction is aborted now, so the whole run must roll back
+                self.failed = True
+                raise
+
+
+@contextmanager
+def borrow_connection(db):
+    """
+    Yield a connection for a store_* method.
+
+    `db` is either an IngestDatabase / run transaction, or a plain db_config dict,
+    in which case a one-off connection is opened, committed and closed.
+    """
+    if not isinstance(db, dict):
+        with db.connection() as conn:
+            yield conn
+        return
+
+    conn = psycopg2.connect(**db)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,166 @@
+import argparse
+import itertools
+import json
+import logging
+
+import psycopg2
+
+from whoop_db import BulkWriter, IngestDatabase, borrow_connection
+from whoop_records import FLATTENERS
+from whoop_rollup import days_of, refresh_daily_summary
+
+# Raw records that could not be flattened or written, kept for inspection and re-processing
+DEAD_LETTER_DDL = """
+    CREATE TABLE IF NOT EXISTS dead_letter_records (
+        id BIGSERIAL PRIMARY KEY,
+        table_name VARCHAR NOT NULL,
+        user_id VARCHAR,
+        record JSONB,
+        error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Errors caused by the data of a row; anything else (lost connection, missing table) still fails the batch
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+_savepoint_ids = itertools.count()
+
+
+def ensure_dead_letter_table(cursor):
+    cursor.execute(DEAD_LETTER_DDL)
+
+
+def flatten_isolated(flattener, records, user_id):
+    """Flatten a page, falling back to one record at a time when a record does not fit the mapping."""
+    try:
+        return flattener.rows(records, user_id), list(records), []
+    except Exception:
+        rows, kept, rejected = [], [], []
+        for record in records:
+            try:
+                rows.extend(flattener.rows([record], user_id))
+                kept.append(record)
+            except Exception as e:
+                rejected.append((record, f"flatten: {e}"))
+        return rows, kept, rejected
+
+
+def _write_bisect(conn, bulk_writer, table, rows, records, rejected, written):
+    """
+    Write rows inside a savepoint. When the batch fails on bad data, roll back to the
+    savepoint and retry each half, until the failing rows are isolated one by one.
+    """
+    if not rows:
+        return
+    savepoint = f"bulk_write_{next(_savepoint_ids)}"
+    with conn.cursor() as cursor:
+        cursor.execute(f"SAVEPOINT {savepoint}")
+    try:
+        bulk_writer.write(conn, table, rows)
+    except ROW_ERRORS as e:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+        if len(rows) == 1:
+            rejected.append((records[0], f"{type(e).__name__}: {str(e).strip().splitlines()[0]}"))
+            return
+        middle = len(rows) // 2
+        _write_bisect(conn, bulk_writer, table, rows[:middle], records[:middle], rejected, written)
+        _write_bisect(conn, bulk_writer, table, rows[middle:], records[middle:], rejected, written)
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+    written.extend(rows)
+
+
+def store_isolated(conn, bulk_writer, flattener, records, user_id):
+    """
+    Flatten and write a page of API records so that one bad record cannot fail the page.
+
+    Records that fail to flatten or to write are moved to dead_letter_records (raw JSON
+    and error) in the same transaction, and the rest are stored. Returns the rows written.
+    """
+    table = flattener.table
+    rows, kept, rejected = flatten_isolated(flattener, records, user_id)
+    written = []
+    _write_bisect(conn, bulk_writer, table, rows, kept, rejected, written)
+    dead_letter(conn, table, user_id, rejected, bulk_writer.metrics)
+    return written
+
+
+def dead_letter(conn, table, user_id, rejected, metrics=None):
+    """Save (record, error) pairs that could not be stored in dead_letter_records."""
+    if not rejected:
+        return
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO dead_letter_records (table_name, user_id, record, error) VALUES (%s, %s, %s, %s)",
+            [(table.name, str(user_id), json.dumps(record, default=str), error) for record, error in rejected]
+        )
+    if metrics is not None:
+        metrics.inc("whoop_dead_letter_records_total", len(rejected), table=table.name)
+    logging.warning(f"Moved {len(rejected)} {table.name} records to dead_letter_records: {rejected[0][1]}")
+
+
+def reprocess_dead_letters(database, bulk_writer, table_name=None):
+    """
+    Re-flatten and re-write dead-lettered records with the current mappings, without any API calls.
+
+    Records are stored per table and user through the database's storage backend, and their
+    dead_letter_records rows are deleted once the write went through. Records that still fail
+    are dead-lettered again with their new error. The daily rollup is refreshed for the days
+    written. Returns the number of records reprocessed and rows written per table.
+    """
+    # whoop_storage imports this module
+    from whoop_storage import storage_for
+
+    flatteners = {flattener.table.name: flattener for flattener in FLATTENERS.values()}
+    counts = {}
+    with database.run() as store_db:
+        with borrow_connection(store_db) as conn, conn.cursor() as cursor:
+            query = "SELECT id, table_name, user_id, CAST(record AS VARCHAR) FROM dead_letter_records"
+            if table_name:
+                cursor.execute(query + " WHERE table_name = %s ORDER BY id", (table_name,))
+            else:
+                cursor.execute(query + " ORDER BY id")
+            groups = {}
+            for record_id, table, user_id, record in cursor.fetchall():
+                groups.setdefault((table, user_id), []).append((record_id, json.loads(record)))
+
+        for (table, user_id), entries in groups.items():
+            flattener = flatteners.get(table)
+            if flattener is None:
+                logging.warning(f"Skipping {len(entries)} dead-lettered records of unknown table {table}")
+                continue
+            rows = storage_for(store_db).store_records(bulk_writer, flattener, [record for _, record in entries], user_id)
+            with borrow_connection(store_db) as conn, conn.cursor() as cursor:
+                cursor.executemany("DELETE FROM dead_letter_records WHERE id = %s", [(record_id,) for record_id, _ in entries])
+            refresh_daily_summary(store_db, user_id, days_of(flattener.table, rows))
+            table_counts = counts.setdefault(table, {"records": 0, "rows": 0})
+            table_counts["records"] += len(entries)
+            table_counts["rows"] += len(rows)
+
+    logging.info(f"Reprocessed dead-lettered records: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-write the records in dead_letter_records with the current mappings.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--db-config", help="JSON file with psycopg2 connection settings (DB_CONFIG)")
+    target.add_argument("--duckdb", help="DuckDB file written with STORAGE_BACKEND = \"duckdb\"")
+    parser.add_argument("--table", help="only reprocess records of this table, e.g. cycle_data")
+    parser.add_argument("--upsert", action="store_true", help="update stored rows instead of skipping them")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from whoop_storage import DuckDBStorage
+
+    if args.duckdb:
+        database = DuckDBStorage(args.duckdb, upsert=args.upsert)
+    else:
+        with open(args.db_config, "r", encoding="utf-8") as config_file:
+            database = IngestDatabase(json.load(config_file), maxconn=1)
+    print(json.dumps(reprocess_dead_letters(database, BulkWriter(upsert=args.upsert), args.table)))
+    database.close()
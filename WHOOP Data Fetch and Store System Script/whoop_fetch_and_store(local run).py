@@ -1,354 +1,579 @@
-import logging
-from authlib.integrations.requests_client import OAuth2Session
-import psycopg2
-from datetime import datetime
-
-import os
-
-# Set up logging for tracking execution and errors
-# Append a timestamp to the log filename to prevent overwriting
-log_file_path = os.path.abspath("D:/Gen AI Project/Whoop data store script/Logs/whoop_fetch_and_store_" \
-                                + datetime.now().strftime("%Y%m%d_%H%M%S") + ".log")
-logging.basicConfig(filename=log_file_path, level=logging.INFO, 
-                    format="%(asctime)s - %(levelname)s - %(message)s")
-
-
-class WhoopClient:
-    """A client for interacting with the WHOOP API."""
-
-    AUTH_URL = "https://api-7.whoop.com"
-    REQUEST_URL = "https://api.prod.whoop.com/developer"
-    TOKEN_ENDPOINT_AUTH_METHOD = "password_json"
-
-    def __init__(self, username, password):
-        # Initialize with user credentials and set up OAuth2 session
-        self.username = username
-        self.password = password
-        self.session = OAuth2Session(
-            token_endpoint=f"{self.AUTH_URL}/oauth/token",
-            token_endpoint_auth_method=self.TOKEN_ENDPOINT_AUTH_METHOD,
-        )
-        # Register custom authentication method for password grant
-        self.session.register_client_auth_method(("password_json", self._auth_password_json))
-        self.user_id = None
-        self.authenticate()
-
-    def _auth_password_json(self, _client, _method, uri, headers, body):
-        """Custom auth method to handle JSON body for password grant."""
-        import json
-        from authlib.common.urls import extract_params
-        body = json.dumps(dict(extract_params(body)))
-        headers["Content-Type"] = "application/json"
-        return uri, headers, body
-
-    def authenticate(self):
-        """Authenticate the client and fetch the access token."""
-        logging.info("Authenticating with WHOOP API...")
-        token = self.session.fetch_token(
-            url=f"{self.AUTH_URL}/oauth/token",
-            username=self.username,
-            password=self.password,
-            grant_type="password",
-        )
-        # Extract user ID from the token
-        self.user_id = token.get("user", {}).get("id", "")
-        logging.info(f"Authenticated successfully! User ID: {self.user_id}")
-
-    def make_request(self, method, endpoint, params=None):
-        """Make a single API request to the specified endpoint."""
-        url = f"{self.REQUEST_URL}/{endpoint}"
-        response = self.session.request(method, url, params=params)
-        response.raise_for_status()  # Raise an error for HTTP issues
-        return response.json()
-
-    def _make_paginated_request(self, method, endpoint, params=None, max_records=500):
-        """Handle paginated API requests to fetch a specified number of records."""
-        if params is None:
-            params = {}
-        all_records = []
-        count = 0
-
-        # Loop through paginated results
-        while count < max_records:
-            response = self.make_request(method, endpoint, params)
-            records = response.get("records", [])
-            all_records.extend(records)
-
-            count += len(records)
-            # Stop if no more records or max_records reached
-            if count >= max_records or not response.get("next_token"):
-                break
-
-            params["next_token"] = response.get("next_token")
-
-        return all_records[:max_records]
-
-    # API Endpoints
-    def get_profile(self):
-        """Fetch basic user profile data."""
-        return self.make_request("GET", "v1/user/profile/basic")
-
-    def get_body_measurement(self):
-        """Fetch body measurement data."""
-        return self.make_request("GET", "v1/user/measurement/body")
-
-    def get_cycle_collection(self, start_date=None, end_date=None):
-        """Fetch cycle data within a date range."""
-        params = {}
-        if start_date:
-            params["filter"] = f"start={start_date}T00:00:00.000Z"
-        if end_date:
-            params["filter"] += f"&end={end_date}T00:00:00.000Z"
-        return self._make_paginated_request("GET", "v1/cycle", params)
-
-    def get_recovery_collection(self, start_date=None, end_date=None):
-        """Fetch recovery data within a date range."""
-        params = {}
-        if start_date:
-            params["filter"] = f"start={start_date}T00:00:00.000Z"
-        if end_date:
-            params["filter"] += f"&end={end_date}T00:00:00.000Z"
-        return self._make_paginated_request("GET", "v1/recovery", params)
-
-    def get_sleep_collection(self, start_date=None, end_date=None):
-        """Fetch sleep data within a date range."""
-        params = {}
-        if start_date:
-            params["filter"] = f"start={start_date}T00:00:00.000Z"
-        if end_date:
-            params["filter"] += f"&end={end_date}T00:00:00.000Z"
-        return self._make_paginated_request("GET", "v1/activity/sleep", params)
-
-    def get_workout_collection(self, start_date=None, end_date=None):
-        """Fetch workout data within a date range."""
-        params = {}
-        if start_date:
-            params["filter"] = f"start={start_date}T00:00:00.000Z"
-        if end_date:
-            params["filter"] += f"&end={end_date}T00:00:00.000Z"
-        return self._make_paginated_request("GET", "v1/activity/workout", params)
-
-    # Database storage methods
-    def store_user(self, data, db_config):
-        """Store user profile data in the database."""
-        try:
-            conn = psycopg2.connect(**db_config)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO users (user_id, first_name, last_name, email)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (user_id) DO NOTHING
-            """, (
-                data.get("user_id"),
-                data.get("first_name"),
-                data.get("last_name"),
-                data.get("email")
-            ))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info("User data stored successfully!")
-        except Exception as e:
-            logging.error(f"Error storing user data: {e}")
-
-    def store_body_measurements(self, data, db_config):
-        """Store body measurement data in the database."""
-        try:
-            conn = psycopg2.connect(**db_config)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO body_measurements (user_id, height_meter, weight_kilogram, max_heart_rate)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (user_id) DO NOTHING
-            """, (
-                self.user_id,
-                data.get("height_meter"),
-                data.get("weight_kilogram"),
-                data.get("max_heart_rate")
-            ))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info("Body measurements stored successfully!")
-        except Exception as e:
-            logging.error(f"Error storing body measurements: {e}")
-
-    def store_cycle_data(self, data, db_config):
-        """Store cycle data in the database."""
-        try:
-            conn = psycopg2.connect(**db_config)
-            cursor = conn.cursor()
-            for record in data:
-                cursor.execute("""
-                    INSERT INTO cycle_data (cycle_id, user_id, strain, kilojoule, average_heart_rate, max_heart_rate, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (cycle_id) DO NOTHING
-                """, (
-                    record.get("id"),
-                    self.user_id,
-                    record.get("score", {}).get("strain", None),
-                    record.get("score", {}).get("kilojoule", None),
-                    record.get("score", {}).get("average_heart_rate", None),
-                    record.get("score", {}).get("max_heart_rate", None),
-                    record.get("created_at")
-                ))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info("Cycle data stored successfully!")
-        except Exception as e:
-            logging.error(f"Error storing cycle data: {e}")
-
-    def store_recovery_data(self, data, db_config):
-        """Store recovery data in the database."""
-        try:
-            conn = psycopg2.connect(**db_config)
-            cursor = conn.cursor()
-            for record in data:
-                cursor.execute("""
-                    INSERT INTO recovery_data (cycle_id, sleep_id, user_id, score_state, recovery_score, resting_heart_rate,
-                                               hrv_rmssd_milli, spo2_percentage, skin_temp_celsius, created_at, updated_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (cycle_id) DO NOTHING
-                """, (
-                    record.get("cycle_id"),
-                    record.get("sleep_id", None),
-                    self.user_id,
-                    record.get("score_state", None),
-                    record.get("score", {}).get("recovery_score", None),
-                    record.get("score", {}).get("resting_heart_rate", None),
-                    record.get("score", {}).get("hrv_rmssd_milli", None),
-                    record.get("score", {}).get("spo2_percentage", None),
-                    record.get("score", {}).get("skin_temp_celsius", None),
-                    record.get("created_at"),
-                    record.get("updated_at")
-                ))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info("Recovery data stored successfully!")
-        except Exception as e:
-            logging.error(f"Error storing recovery data: {e}")
-
-    def store_sleep_data(self, data, db_config):
-        """Store sleep data in the database."""
-        try:
-            conn = psycopg2.connect(**db_config)
-            cursor = conn.cursor()
-            for record in data:
-                cursor.execute("""
-                    INSERT INTO sleep_data (user_id, total_sleep_time, rem_sleep_time, deep_sleep_time, efficiency,
-                                            timestamp, disturbance_count, light_sleep_time, nap, respiratory_rate)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT DO NOTHING
-                """, (
-                    self.user_id,
-                    record.get("score", {}).get("stage_summary", {}).get("total_in_bed_time_milli", 0) // 60000,
-                    record.get("score", {}).get("stage_summary", {}).get("total_rem_sleep_time_milli", 0) // 60000,
-                    record.get("score", {}).get("stage_summary", {}).get("total_slow_wave_sleep_time_milli", 0) // 60000,
-                    record.get("score", {}).get("sleep_efficiency_percentage", None),
-                    record.get("start"),
-                    record.get("score", {}).get("stage_summary", {}).get("disturbance_count", 0),
-                    record.get("score", {}).get("stage_summary", {}).get("total_light_sleep_time_milli", 0) // 60000,
-                    record.get("nap", None),
-                    record.get("score", {}).get("respiratory_rate", None)
-                ))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info("Sleep data stored successfully!")
-        except Exception as e:
-            logging.error(f"Error storing sleep data: {e}")
-
-    def store_workout_data(self, data, db_config):
-        """Store workout data in the database."""
-        try:
-            conn = psycopg2.connect(**db_config)
-            cursor = conn.cursor()
-            for record in data:
-                cursor.execute("""
-                    INSERT INTO workout_data (workout_id, user_id, start, end_time, strain, kilojoule, average_heart_rate,
-                                              max_heart_rate, percent_recorded, distance_meter, altitude_gain_meter,
-                                              altitude_change_meter, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (workout_id) DO NOTHING
-                """, (
-                    record.get("id"),
-                    self.user_id,
-                    record.get("start"),
-                    record.get("end", None),
-                    record.get("score", {}).get("strain", None),
-                    record.get("score", {}).get("kilojoule", None),
-                    record.get("score", {}).get("average_heart_rate", None),
-                    record.get("score", {}).get("max_heart_rate", None),
-                    record.get("score", {}).get("percent_recorded", None),
-                    record.get("score", {}).get("distance_meter", 0),
-                    record.get("score", {}).get("altitude_gain_meter", 0),
-                    record.get("score", {}).get("altitude_change_meter", 0),
-                    record.get("created_at", None)
-                ))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info("Workout data stored successfully!")
-        except Exception as e:
-            logging.error(f"Error storing workout data: {e}")
-
-if __name__ == "__main__":
-    # User credentials for WHOOP API
-    USERNAME = "WHOOP_USERNAME"
-    PASSWORD = "WHOOP_PASSWORD"
-
-    # Database configuration for connecting to PostgreSQL
-    DB_CONFIG = {
-        "database": "health_monitor_whoop",
-        "user": "USERNAME",
-        "password": "PASSWORD",
-        "host": "PUBLIC_IP_OF_YOUR_DB",
-        "port": "5432"
-    }
-
-    try:
-        logging.info("Starting WHOOP data fetch and store process.")
-        client = WhoopClient(username=USERNAME, password=PASSWORD)
-
-        # Fetch and store user profile
-        profile = client.get_profile()
-        if profile:
-            logging.info("Storing user profile data...")
-            client.store_user(profile, DB_CONFIG)
-
-        # Fetch and store body measurements
-        body_measurements = client.get_body_measurement()
-        if body_measurements:
-            logging.info("Storing body measurements...")
-            client.store_body_measurements(body_measurements, DB_CONFIG)
-
-        # Fetch and store cycle data
-        cycle_data = client.get_cycle_collection(start_date="2024-12-01", end_date="2024-12-12")
-        if cycle_data:
-            logging.info(f"Storing {len(cycle_data)} cycle records...")
-            client.store_cycle_data(cycle_data, DB_CONFIG)
-
-        # Fetch and store recovery data
-        recovery_data = client.get_recovery_collection(start_date="2024-12-01", end_date="2024-12-12")
-        if recovery_data:
-            logging.info(f"Storing {len(recovery_data)} recovery records...")
-            client.store_recovery_data(recovery_data, DB_CONFIG)
-
-        # Fetch and store sleep data
-        sleep_data = client.get_sleep_collection(start_date="2024-12-01", end_date="2024-12-12")
-        if sleep_data:
-            logging.info(f"Storing {len(sleep_data)} sleep records...")
-            client.store_sleep_data(sleep_data, DB_CONFIG)
-
-        # Fetch and store workout data
-        workout_data = client.get_workout_collection(start_date="2024-12-01", end_date="2024-12-12")
-        if workout_data:
-            logging.info(f"Storing {len(workout_data)} workout records...")
-            client.store_workout_data(workout_data, DB_CONFIG)
-
-        logging.info("WHOOP data fetch and store process completed successfully.")
-
-    except Exception as e:
-        logging.error(f"An error occurred: {e}")
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from authlib.integrations.requests_client import OAuth2Session
+import requests
+from datetime import datetime, timedelta, timezone
+from whoop_pipeline import stream_collections
+from whoop_sync import run_incremental_sync
+from whoop_backfill import backfill
+from whoop_schema import ensure_sync_partitions, migrate
+from whoop_rollup import days_of, refresh_daily_summary
+from whoop_landing import RawArchive, replay_archive
+from whoop_metrics import METRICS
+from whoop_jobs import job_stage
+from whoop_accounts import ingest_accounts, load_accounts
+from whoop_token_cache import TokenCache
+from whoop_rate_limit import AdaptiveRateLimiter, backoff_delay, parse_retry_after
+from whoop_storage import DuckDBStorage, storage_for
+from whoop_records import CYCLE_RECORDS, RECOVERY_RECORDS, SLEEP_RECORDS, WORKOUT_RECORDS, decode_json
+from whoop_db import BulkWriter, IngestDatabase, borrow_connection, CYCLE_DATA, RECOVERY_DATA, SLEEP_DATA, WORKOUT_DATA
+
+import os
+
+# Set up logging for tracking execution and errors
+# Append a timestamp to the log filename to prevent overwriting
+log_file_path = os.path.abspath("D:/Gen AI Project/Whoop data store script/Logs/whoop_fetch_and_store_" \
+                                + datetime.now().strftime("%Y%m%d_%H%M%S") + ".log")
+logging.basicConfig(filename=log_file_path, level=logging.INFO, 
+                    format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class WhoopClient:
+    """A client for interacting with the WHOOP API."""
+
+    AUTH_URL = "https://api-7.whoop.com"
+    REQUEST_URL = "https://api.prod.whoop.com/developer"
+    TOKEN_ENDPOINT_AUTH_METHOD = "password_json"
+    MAX_RETRIES = 5  # Retries for 429, 5xx and connection errors
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    DEFAULT_REQUESTS_PER_SECOND = 1.5  # Used when no shared rate limiter is passed in
+    COLLECTION_ENDPOINTS = {
+        "cycle": "v1/cycle",
+        "recovery": "v1/recovery",
+        "sleep": "v1/activity/sleep",
+        "workout": "v1/activity/workout",
+    }
+
+    def __init__(self, username, password, token_cache=None, rate_limiter=None, bulk_writer=None, raw_archive=None,
+                 metrics=None):
+        # Initialize with user credentials and set up OAuth2 session
+        self.username = username
+        self.password = password
+        # Optional TokenCache; when set, tokens are reused across runs instead of logging in each time
+        self.token_cache = token_cache
+        # Token bucket shared by every request of this client (pass one in to share it across clients)
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(self.DEFAULT_REQUESTS_PER_SECOND)
+        self.session = OAuth2Session(
+            token_endpoint=f"{self.AUTH_URL}/oauth/token",
+            token_endpoint_auth_method=self.TOKEN_ENDPOINT_AUTH_METHOD,
+            update_token=self._on_token_refreshed,
+        )
+        # Register custom authentication method for password grant
+        self.session.register_client_auth_method(("password_json", self._auth_password_json))
+        self.user_id = None
+        # Batched writer used by the store_* methods for collection data (BulkWriter(upsert=True) updates re-scored rows)
+        self.bulk_writer = bulk_writer or BulkWriter()
+        # Optional RawArchive that keeps every fetched page for offline replay
+        self.raw_archive = raw_archive
+        # Pages, records, request latency and retries are recorded here (a per-job registry or the process one)
+        self.metrics = metrics or METRICS
+        # Days stored by this client, so the daily rollup only recomputes those
+        self.touched_days = set()
+        self.authenticate()
+
+    def _auth_password_json(self, _client, _method, uri, headers, body):
+        """Custom auth method to handle JSON body for password grant."""
+        import json
+        from authlib.common.urls import extract_params
+        body = json.dumps(dict(extract_params(body)))
+        headers["Content-Type"] = "application/json"
+        return uri, headers, body
+
+    def authenticate(self):
+        """Authenticate the client, reusing or refreshing a cached token when possible."""
+        token = self._token_from_cache()
+        if token is None:
+            logging.info("Authenticating with WHOOP API...")
+            token = self.session.fetch_token(
+                url=f"{self.AUTH_URL}/oauth/token",
+                username=self.username,
+                password=self.password,
+                grant_type="password",
+            )
+            self._save_token(token)
+        # Extract user ID from the token
+        self.user_id = (token.get("user") or {}).get("id", "")
+        logging.info(f"Authenticated successfully! User ID: {self.user_id}")
+
+    def _token_from_cache(self):
+        """Return a usable cached token (refreshing it if needed), or None to fall back to a password login."""
+        if self.token_cache is None:
+            return None
+        cached = self.token_cache.load(self.username)
+        if not cached:
+            return None
+        if self.token_cache.is_valid(cached):
+            logging.info("Reusing cached WHOOP token.")
+            self.session.token = cached
+            return cached
+        if not cached.get("refresh_token"):
+            return None
+        try:
+            logging.info("Refreshing cached WHOOP token...")
+            self.session.token = cached
+            token = self.session.refresh_token(
+                f"{self.AUTH_URL}/oauth/token", refresh_token=cached["refresh_token"]
+            )
+        except Exception as e:
+            logging.warning(f"Token refresh failed, logging in with password instead: {e}")
+            self.token_cache.clear(self.username)
+            return None
+        self._save_token(token, previous=cached)
+        return token
+
+    def _save_token(self, token, previous=None):
+        """Write a token to the cache, keeping the user block and refresh token the refresh response may omit."""
+        if self.token_cache is None:
+            return
+        if previous:
+            token.setdefault("user", previous.get("user"))
+            token.setdefault("refresh_token", previous.get("refresh_token"))
+        self.token_cache.save(self.username, token)
+
+    def _on_token_refreshed(self, token, refresh_token=None, access_token=None):
+        """Persist tokens the session refreshes automatically in the middle of a run."""
+        self._save_token(token, previous=self.token_cache.load(self.username) if self.token_cache else None)
+
+    def make_request(self, method, endpoint, params=None, label=None):
+        """
+        Make a single API request, retrying throttled and transient failures with jittered backoff.
+        Metrics are labelled with label (default: the endpoint), e.g. a template for per-record URLs.
+        """
+        url = f"{self.REQUEST_URL}/{endpoint}"
+        label = label or endpoint
+        for attempt in range(self.MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, params=params)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.observe("whoop_http_request_seconds", time.perf_counter() - started,
+                                     endpoint=label, status="error")
+                if attempt == self.MAX_RETRIES:
+                    raise
+                self.metrics.inc("whoop_http_retries_total", endpoint=label, reason="connection_error")
+                delay = backoff_delay(attempt)
+                logging.warning(f"Request to {endpoint} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.metrics.observe("whoop_http_request_seconds", time.perf_counter() - started,
+                                 endpoint=label, status=response.status_code)
+            if response.status_code in self.RETRY_STATUSES and attempt < self.MAX_RETRIES:
+                self.metrics.inc("whoop_http_retries_total", endpoint=label, reason=response.status_code)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    # The limiter slows down and pauses every caller until Retry-After
+                    self.rate_limiter.on_throttled(retry_after)
+                    if retry_after:
+                        continue
+                delay = retry_after or backoff_delay(attempt)
+                logging.warning(f"{endpoint} returned {response.status_code}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()  # Raise an error for HTTP issues
+            self.rate_limiter.on_success()
+            started = time.perf_counter()
+            payload = decode_json(response.content)
+            self.metrics.observe("whoop_json_decode_seconds", time.perf_counter() - started, endpoint=label)
+            return payload
+
+    def iter_pages(self, method, endpoint, params=None, max_records=None):
+        """
+        Yield each page of records as soon as it arrives.
+        With max_records=None the next_token chain is followed to the end.
+        """
+        params = dict(params or {})
+        count = 0
+
+        # Loop through paginated results
+        while True:
+            response = self.make_request(method, endpoint, params)
+            records = response.get("records", [])
+            if max_records is not None:
+                records = records[:max_records - count]
+            count += len(records)
+            self.metrics.inc("whoop_pages_total", endpoint=endpoint)
+            self.metrics.inc("whoop_records_total", len(records), endpoint=endpoint)
+            if records:
+                if self.raw_archive is not None:
+                    self.raw_archive.append(self.user_id, endpoint, records)
+                yield records
+
+            # Stop if no more records or max_records reached
+            next_token = response.get("next_token")
+            if not next_token:
+                break
+            if max_records is not None and count >= max_records:
+                logging.warning(f"{endpoint}: stopped at max_records={max_records} although more records exist; "
+                                "use the backfill mode to import everything.")
+                break
+
+            params["next_token"] = next_token
+
+    def _make_paginated_request(self, method, endpoint, params=None, max_records=500):
+        """Handle paginated API requests to fetch a specified number of records."""
+        all_records = []
+        for records in self.iter_pages(method, endpoint, params, max_records):
+            all_records.extend(records)
+        return all_records
+
+    # API Endpoints
+    def get_profile(self):
+        """Fetch basic user profile data."""
+        return self.make_request("GET", "v1/user/profile/basic")
+
+    def get_body_measurement(self):
+        """Fetch body measurement data."""
+        return self.make_request("GET", "v1/user/measurement/body")
+
+    def get_cycle_collection(self, start_date=None, end_date=None):
+        """Fetch cycle data within a date range."""
+        params = {}
+        if start_date:
+            params["filter"] = f"start={start_date}T00:00:00.000Z"
+        if end_date:
+            params["filter"] += f"&end={end_date}T00:00:00.000Z"
+        return self._make_paginated_request("GET", "v1/cycle", params)
+
+    def get_recovery_collection(self, start_date=None, end_date=None):
+        """Fetch recovery data within a date range."""
+        params = {}
+        if start_date:
+            params["filter"] = f"start={start_date}T00:00:00.000Z"
+        if end_date:
+            params["filter"] += f"&end={end_date}T00:00:00.000Z"
+        return self._make_paginated_request("GET", "v1/recovery", params)
+
+    def get_sleep_collection(self, start_date=None, end_date=None):
+        """Fetch sleep data within a date range."""
+        params = {}
+        if start_date:
+            params["filter"] = f"start={start_date}T00:00:00.000Z"
+        if end_date:
+            params["filter"] += f"&end={end_date}T00:00:00.000Z"
+        return self._make_paginated_request("GET", "v1/activity/sleep", params)
+
+    def get_workout_collection(self, start_date=None, end_date=None):
+        """Fetch workout data within a date range."""
+        params = {}
+        if start_date:
+            params["filter"] = f"start={start_date}T00:00:00.000Z"
+        if end_date:
+            params["filter"] += f"&end={end_date}T00:00:00.000Z"
+        return self._make_paginated_request("GET", "v1/activity/workout", params)
+
+    @staticmethod
+    def _filter_time(value):
+        """Format a date ("2024-12-01"), an ISO timestamp or a datetime for the collection filter."""
+        if isinstance(value, datetime):
+            value = value.astimezone(timezone.utc)
+            return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+        if len(value) == 10:
+            return f"{value}T00:00:00.000Z"
+        return value
+
+    def iter_collection_pages(self, collection, start_date=None, end_date=None, max_records=None):
+        """
+        Yield pages of a collection ("cycle", "recovery", "sleep" or "workout") within a date range.
+        Bounds may be dates, ISO timestamps or datetimes; end_date=None means up to now.
+        """
+        params = {}
+        if start_date:
+            params["filter"] = f"start={self._filter_time(start_date)}"
+        if end_date:
+            params["filter"] += f"&end={self._filter_time(end_date)}"
+        return self.iter_pages("GET", self.COLLECTION_ENDPOINTS[collection], params, max_records)
+
+    def get_record(self, collection, record_id):
+        """Fetch a single cycle, sleep or workout by id, e.g. the one a webhook event names."""
+        endpoint = self.COLLECTION_ENDPOINTS[collection]
+        return self.make_request("GET", f"{endpoint}/{record_id}", label=f"{endpoint}/{{id}}")
+
+    def get_collections(self, start_date=None, end_date=None, max_workers=4):
+        """
+        Fetch the cycle, recovery, sleep and workout collections concurrently.
+        At most max_workers collections are crawled at once over the shared session,
+        and the result is always keyed in the same order regardless of which finishes first.
+        """
+        fetchers = {
+            "cycle": self.get_cycle_collection,
+            "recovery": self.get_recovery_collection,
+            "sleep": self.get_sleep_collection,
+            "workout": self.get_workout_collection,
+        }
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                name: executor.submit(fetch, start_date, end_date)
+                for name, fetch in fetchers.items()
+            }
+            return {name: futures[name].result() for name in fetchers}
+
+    # Database storage methods
+    def store_user(self, data, db_config):
+        """Store user profile data in the database."""
+        try:
+            with borrow_connection(db_config) as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO users (user_id, first_name, last_name, email)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (user_id) DO NOTHING
+                """, (
+                    data.get("user_id"),
+                    data.get("first_name"),
+                    data.get("last_name"),
+                    data.get("email")
+                ))
+            logging.info("User data stored successfully!")
+        except Exception as e:
+            logging.error(f"Error storing user data: {e}")
+
+    def store_body_measurements(self, data, db_config):
+        """Store body measurement data in the database."""
+        try:
+            with borrow_connection(db_config) as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO body_measurements (user_id, height_meter, weight_kilogram, max_heart_rate)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (user_id) DO NOTHING
+                """, (
+                    self.user_id,
+                    data.get("height_meter"),
+                    data.get("weight_kilogram"),
+                    data.get("max_heart_rate")
+                ))
+            logging.info("Body measurements stored successfully!")
+        except Exception as e:
+            logging.error(f"Error storing body measurements: {e}")
+
+    def store_cycle_data(self, data, db_config):
+        """Store cycle data in the database. Returns True when the batch was stored."""
+        try:
+            rows = storage_for(db_config).store_records(self.bulk_writer, CYCLE_RECORDS, data, self.user_id)
+            self.touched_days |= days_of(CYCLE_DATA, rows)
+            logging.info("Cycle data stored successfully!")
+            return True
+        except Exception as e:
+            logging.error(f"Error storing cycle data: {e}")
+            return False
+
+    def store_recovery_data(self, data, db_config):
+        """Store recovery data in the database. Returns True when the batch was stored."""
+        try:
+            rows = storage_for(db_config).store_records(self.bulk_writer, RECOVERY_RECORDS, data, self.user_id)
+            self.touched_days |= days_of(RECOVERY_DATA, rows)
+            logging.info("Recovery data stored successfully!")
+            return True
+        except Exception as e:
+            logging.error(f"Error storing recovery data: {e}")
+            return False
+
+    def store_sleep_data(self, data, db_config):
+        """Store sleep data in the database. Returns True when the batch was stored."""
+        try:
+            rows = storage_for(db_config).store_records(self.bulk_writer, SLEEP_RECORDS, data, self.user_id)
+            self.touched_days |= days_of(SLEEP_DATA, rows)
+            logging.info("Sleep data stored successfully!")
+            return True
+        except Exception as e:
+            logging.error(f"Error storing sleep data: {e}")
+            return False
+
+    def store_workout_data(self, data, db_config):
+        """Store workout data in the database. Returns True when the batch was stored."""
+        try:
+            rows = storage_for(db_config).store_records(self.bulk_writer, WORKOUT_RECORDS, data, self.user_id)
+            self.touched_days |= days_of(WORKOUT_DATA, rows)
+            logging.info("Workout data stored successfully!")
+            return True
+        except Exception as e:
+            logging.error(f"Error storing workout data: {e}")
+            return False
+
+def ingest_account(client, database, job=None):
+    """
+    Fetch and store one account's profile, body measurements and collections. Returns records per collection.
+    When run under a background job, each stage's duration is recorded on the job.
+    """
+    with database.run() as store_db:
+        # Fetch and store user profile
+        with job_stage(job, "profile"):
+            profile = client.get_profile()
+            if profile:
+                logging.info("Storing user profile data...")
+                client.store_user(profile, store_db)
+
+        # Fetch and store body measurements
+        with job_stage(job, "body_measurements"):
+            body_measurements = client.get_body_measurement()
+            if body_measurements:
+                logging.info("Storing body measurements...")
+                client.store_body_measurements(body_measurements, store_db)
+
+        # Fetch and store the cycle, recovery, sleep and workout collections
+        with job_stage(job, "collections"):
+            if SYNC_MODE == "incremental":
+                # Only request records from each endpoint's high-water mark onwards
+                counts = run_incremental_sync(
+                    client, store_db, overlap=timedelta(hours=SYNC_OVERLAP_HOURS),
+                    initial_start=INITIAL_SYNC_START, max_workers=FETCH_CONCURRENCY,
+                    queue_size=PAGE_QUEUE_SIZE
+                )
+                logging.info(f"Incremental sync records per collection: {counts}")
+            elif SYNC_MODE == "backfill":
+                # Crawl the history as parallel date shards with no record cap
+                counts = backfill(
+                    client, store_db, BACKFILL_START, BACKFILL_END,
+                    shard_days=BACKFILL_SHARD_DAYS, max_workers=BACKFILL_WORKERS, queue_size=PAGE_QUEUE_SIZE
+                )
+            elif STREAM_PAGES:
+                # Pages flow through a bounded queue so network and database I/O overlap
+                counts = stream_collections(
+                    client, store_db, start_date="2024-12-01", end_date="2024-12-12",
+                    max_workers=FETCH_CONCURRENCY, queue_size=PAGE_QUEUE_SIZE
+                )
+                logging.info(f"Streamed records per collection: {counts}")
+            else:
+                # Fetch the four collections concurrently, then store them in a fixed order
+                collections = client.get_collections(
+                    start_date="2024-12-01", end_date="2024-12-12", max_workers=FETCH_CONCURRENCY
+                )
+
+                # Store cycle data
+                cycle_data = collections["cycle"]
+                if cycle_data:
+                    logging.info(f"Storing {len(cycle_data)} cycle records...")
+                    client.store_cycle_data(cycle_data, store_db)
+
+                # Store recovery data
+                recovery_data = collections["recovery"]
+                if recovery_data:
+                    logging.info(f"Storing {len(recovery_data)} recovery records...")
+                    client.store_recovery_data(recovery_data, store_db)
+
+                # Store sleep data
+                sleep_data = collections["sleep"]
+                if sleep_data:
+                    logging.info(f"Storing {len(sleep_data)} sleep records...")
+                    client.store_sleep_data(sleep_data, store_db)
+
+                # Store workout data
+                workout_data = collections["workout"]
+                if workout_data:
+                    logging.info(f"Storing {len(workout_data)} workout records...")
+                    client.store_workout_data(workout_data, store_db)
+
+                counts = {name: len(records) for name, records in collections.items()}
+
+        # Recompute the daily rollup for the days this run stored
+        with job_stage(job, "rollup"):
+            refresh_daily_summary(store_db, client.user_id, client.touched_days)
+
+    return counts
+
+
+if __name__ == "__main__":
+    # User credentials for WHOOP API
+    USERNAME = "WHOOP_USERNAME"
+    PASSWORD = "WHOOP_PASSWORD"
+
+    # Database configuration for connecting to PostgreSQL
+    DB_CONFIG = {
+        "database": "health_monitor_whoop",
+        "user": "USERNAME",
+        "password": "PASSWORD",
+        "host": "PUBLIC_IP_OF_YOUR_DB",
+        "port": "5432"
+    }
+
+    # "postgres" stores into DB_CONFIG; "duckdb" stores into the local DuckDB file DUCKDB_PATH (needs pip install duckdb)
+    STORAGE_BACKEND = "postgres"
+    DUCKDB_PATH = "whoop.duckdb"
+    # Connection pool shared by the store methods (max open connections)
+    DB_POOL_SIZE = 4
+    # "table" commits after each page (store call) is stored; "run" commits the whole ingest as one transaction
+    TRANSACTION_MODE = "table"
+    # Update rows WHOOP re-scored (changed content, not older updated_at) instead of keeping the first version
+    UPSERT_CHANGED_ROWS = True
+    # Number of collections (cycle, recovery, sleep, workout) fetched in parallel; 1 fetches serially
+    FETCH_CONCURRENCY = 4
+    # "incremental" fetches only records newer than the stored high-water marks; "range" re-fetches the fixed date range;
+    # "backfill" imports BACKFILL_START..BACKFILL_END as parallel date shards;
+    # "replay" rebuilds the tables from RAW_ARCHIVE_DIR without calling the API
+    SYNC_MODE = "incremental"
+    # How far before each high-water mark to restart, to pick up scores WHOOP finalizes late
+    SYNC_OVERLAP_HOURS = 72
+    # Where the first incremental sync of an endpoint starts
+    INITIAL_SYNC_START = "2024-12-01"
+    # History window, shard length and parallel shard crawls for SYNC_MODE = "backfill"
+    BACKFILL_START = "2022-01-01"
+    BACKFILL_END = "2024-12-12"
+    BACKFILL_SHARD_DAYS = 7
+    BACKFILL_WORKERS = 8
+    # Store each page as soon as it is fetched instead of loading whole collections first
+    STREAM_PAGES = True
+    # Max pages buffered between the fetch threads and the database writer
+    PAGE_QUEUE_SIZE = 8
+    # JSON list of {"username", "password"} accounts to ingest; USERNAME/PASSWORD is used when it is missing
+    ACCOUNTS_FILE = "whoop_accounts.json"
+    # Accounts ingested in parallel (keep DB_POOL_SIZE at least this large)
+    ACCOUNT_WORKERS = 4
+    # Owner-only directory where OAuth tokens are cached between runs
+    TOKEN_CACHE_DIR = ".whoop_token_cache"
+    # Requests/sec allowed by the WHOOP API across all accounts; the limiter backs off from here on 429s
+    API_REQUESTS_PER_SECOND = 1.5
+    # Directory where every fetched page is archived as compressed NDJSON for offline replay; None disables it
+    RAW_ARCHIVE_DIR = "whoop_raw"
+    # Monthly partitions of the collection tables attached ahead of the current month
+    PARTITION_MONTHS_AHEAD = 3
+
+    try:
+        logging.info("Starting WHOOP data fetch and store process.")
+        if STORAGE_BACKEND == "duckdb":
+            # In-process columnar storage; the file is created with every table on first use
+            database = DuckDBStorage(DUCKDB_PATH, upsert=UPSERT_CHANGED_ROWS)
+        else:
+            database = IngestDatabase(DB_CONFIG, maxconn=DB_POOL_SIZE, transaction=TRANSACTION_MODE)
+            migrate(database, months_ahead=PARTITION_MONTHS_AHEAD)
+            # Attach the partitions of the whole window this run stores, so no row lands in the default partition
+            first_day = {
+                "backfill": BACKFILL_START,
+                "incremental": INITIAL_SYNC_START,
+                "replay": RawArchive(RAW_ARCHIVE_DIR).first_date() if RAW_ARCHIVE_DIR else None,
+            }.get(SYNC_MODE, "2024-12-01")
+            if first_day:
+                ensure_sync_partitions(database, first_day, months_ahead=PARTITION_MONTHS_AHEAD)
+
+        if SYNC_MODE == "replay":
+            # Rebuild the collection tables from the archived pages, without network access
+            replay_archive(
+                RawArchive(RAW_ARCHIVE_DIR), database, BulkWriter(upsert=UPSERT_CHANGED_ROWS, metrics=METRICS),
+                WhoopClient.COLLECTION_ENDPOINTS
+            )
+            results = []
+        else:
+            # One pipeline per account, ACCOUNT_WORKERS at a time, all sharing the connection pool
+            results = ingest_accounts(
+                load_accounts(ACCOUNTS_FILE, USERNAME, PASSWORD),
+                partial(WhoopClient, token_cache=TokenCache(TOKEN_CACHE_DIR),
+                        rate_limiter=AdaptiveRateLimiter(API_REQUESTS_PER_SECOND),
+                        bulk_writer=BulkWriter(upsert=UPSERT_CHANGED_ROWS, metrics=METRICS),
+                        raw_archive=RawArchive(RAW_ARCHIVE_DIR) if RAW_ARCHIVE_DIR else None),
+                ingest_account, database, max_workers=ACCOUNT_WORKERS
+            )
+        logging.info(f"Database pool stats: {database.stats()}")
+        logging.info(f"Run metrics: {json.dumps(METRICS.summary())}")
+        database.close()
+
+        failed = [result["username"] for result in results if result["status"] != "ok"]
+        if failed:
+            logging.error(f"Ingest failed for {len(failed)} of {len(results)} accounts: {failed}")
+        else:
+            logging.info("WHOOP data fetch and store process completed successfully.")
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
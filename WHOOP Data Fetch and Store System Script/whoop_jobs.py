@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+
+class Job:
+    """One queued ingest run, with its progress and per-stage timings."""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.progress = "Waiting for a worker"
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def set_progress(self, message):
+        self.progress = message
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage; concurrent stages with the same name (e.g. one per account) add up."""
+        self.set_progress(f"Running {name}")
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stage = self.stages.setdefault(name, {"seconds": 0.0, "count": 0})
+                stage["seconds"] = round(stage["seconds"] + elapsed, 3)
+                stage["count"] += 1
+
+    def to_dict(self):
+        finished = self.finished_at or datetime.now(timezone.utc)
+        return {
+            "job_id": self.id,
+            "key": self.key,
+            "status": self.status,
+            "progress": self.progress,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_seconds": round((finished - self.started_at).total_seconds(), 3) if self.started_at else None,
+            "stages": dict(self.stages),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def job_stage(job, name):
+    """job.stage(name) when running under a job, otherwise a no-op context."""
+    return job.stage(name) if job is not None else nullcontext()
+
+
+class JobRunner:
+    """
+    In-process background worker for ingest runs triggered over HTTP.
+
+    submit() returns immediately with a Job. A trigger whose key matches a job that is
+    still queued or running is coalesced into that job instead of starting a second one.
+    The most recent `history` jobs are kept for status lookups.
+    """
+
+    def __init__(self, max_workers=1, history=100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="whoop-job")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        self.history = history
+
+    def submit(self, key, target, *args, **kwargs):
+        """Queue target(job, *args, **kwargs). Returns (job, created); created is False when coalesced."""
+        with self._lock:
+            running = self._active.get(key)
+            if running is not None and running.active:
+                logging.info(f"Coalescing trigger into job {running.id} ({key})")
+                return running, False
+
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+
+        self._executor.submit(self._run, job, target, args, kwargs)
+        logging.info(f"Queued job {job.id} ({key})")
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, target, args, kwargs):
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            job.result = target(job, *args, **kwargs)
+            job.status = "succeeded"
+            job.progress = "Completed"
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {e}")
+            job.status = "failed"
+            job.progress = "Failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
@@ -0,0 +1,140 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from whoop_records import FLATTENERS, decode_json
+from whoop_rollup import days_of, refresh_daily_summary
+from whoop_storage import storage_for
+from whoop_sync import record_timestamp
+
+# Files written by this process; a new process never appends to another one's files
+_PART_NAME = f"part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.ndjson.gz"
+
+# One lock per part file, shared by every RawArchive in the process since they all append to _PART_NAME
+_part_locks = {}
+_part_locks_lock = threading.Lock()
+
+
+def _part_lock(path):
+    with _part_locks_lock:
+        return _part_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _partition_value(value):
+    """Make a user id or endpoint safe to use as a directory name."""
+    return str(value).replace("/", "_")
+
+
+class RawArchive:
+    """
+    Landing zone for the raw API pages, kept so the tables can be rebuilt without WHOOP.
+
+    Records are appended as gzip-compressed NDJSON under
+    <root>/user_id=<id>/endpoint=<endpoint>/date=<YYYY-MM-DD>/, partitioned by each
+    record's start (or created_at) date. Every append adds a gzip member, so files
+    are never rewritten.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _partition_dir(self, user_id, endpoint, date):
+        return os.path.join(
+            self.root, f"user_id={_partition_value(user_id)}", f"endpoint={_partition_value(endpoint)}", f"date={date}"
+        )
+
+    def append(self, user_id, endpoint, records):
+        """Append one page of records for a user and endpoint."""
+        by_date = {}
+        for record in records:
+            seen = record_timestamp(record)
+            date = seen.astimezone(timezone.utc).date().isoformat() if seen else "unknown"
+            by_date.setdefault(date, []).append(json.dumps(record, default=str))
+
+        for date, lines in by_date.items():
+            directory = self._partition_dir(user_id, endpoint, date)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, _PART_NAME)
+            with _part_lock(path), gzip.open(path, "at", encoding="utf-8") as part:
+                part.write("\n".join(lines) + "\n")
+
+    def users(self):
+        """User ids that have archived pages."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name.split("=", 1)[1] for name in os.listdir(self.root) if name.startswith("user_id=")
+        )
+
+    def first_date(self, user_id=None):
+        """Oldest archived record date ("YYYY-MM-DD") of a user, or of every user; None when nothing is archived."""
+        dates = []
+        for user in [user_id] if user_id is not None else self.users():
+            user_dir = os.path.join(self.root, f"user_id={_partition_value(user)}")
+            if not os.path.isdir(user_dir):
+                continue
+            for endpoint in os.listdir(user_dir):
+                dates += [
+                    name.split("=", 1)[1] for name in os.listdir(os.path.join(user_dir, endpoint))
+                    if name.startswith("date=") and name != "date=unknown"
+                ]
+        return min(dates, default=None)
+
+    def iter_records(self, user_id, endpoint, start_date=None, end_date=None):
+        """Yield a user's archived records for an endpoint, oldest partition and file first."""
+        directory = os.path.join(self.root, f"user_id={_partition_value(user_id)}", f"endpoint={_partition_value(endpoint)}")
+        if not os.path.isdir(directory):
+            return
+        for partition in sorted(os.listdir(directory)):
+            date = partition.split("=", 1)[1]
+            if date != "unknown" and ((start_date and date < str(start_date)) or (end_date and date > str(end_date))):
+                continue
+            for name in sorted(os.listdir(os.path.join(directory, partition))):
+                with gzip.open(os.path.join(directory, partition, name), "rb") as part:
+                    for line in part:
+                        if line.strip():
+                            yield decode_json(line)
+
+
+def replay_archive(archive, database, bulk_writer, endpoints, user_ids=None, start_date=None, end_date=None,
+                   batch_size=5000):
+    """
+    Rebuild the collection tables from the archive without any API calls.
+
+    endpoints maps collection names to their API endpoints (WhoopClient.COLLECTION_ENDPOINTS).
+    Records are flattened with the current field mappings and written in batches of
+    batch_size through bulk_writer, so a mapping fix can be applied to the whole history.
+    The daily rollup is recomputed for every replayed day.
+    Returns the number of records replayed per collection.
+    """
+    started = time.perf_counter()
+    counts = {name: 0 for name in endpoints}
+    with database.run() as store_db:
+        for user_id in user_ids or archive.users():
+            touched_days = set()
+            for name, endpoint in endpoints.items():
+                flattener = FLATTENERS[name]
+                batch = []
+                for record in archive.iter_records(user_id, endpoint, start_date, end_date):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        touched_days |= _write_batch(store_db, bulk_writer, flattener, user_id, batch)
+                        counts[name] += len(batch)
+                        batch = []
+                if batch:
+                    touched_days |= _write_batch(store_db, bulk_writer, flattener, user_id, batch)
+                    counts[name] += len(batch)
+            refresh_daily_summary(store_db, user_id, touched_days)
+
+    logging.info(f"Replayed {counts} archived records in {time.perf_counter() - started:.3f}s")
+    return counts
+
+
+def _write_batch(store_db, bulk_writer, flattener, user_id, records):
+    """Write one batch and return the days it covered."""
+    rows = storage_for(store_db).store_records(bulk_writer, flattener, records, user_id)
+    return days_of(flattener.table, rows)
@@ -0,0 +1,131 @@
+import threading
+
+# Counters and histograms recorded by the ingest, with their Prometheus help text
+COUNTERS = {
+    "whoop_pages_total": "Pages of records fetched from the WHOOP API.",
+    "whoop_records_total": "Records fetched from the WHOOP API.",
+    "whoop_http_retries_total": "WHOOP API requests retried, by reason.",
+    "whoop_rows_written_total": "Rows sent to the database by BulkWriter.",
+    "whoop_rows_skipped_total": "Rows skipped by upserts because their content was unchanged.",
+    "whoop_dead_letter_records_total": "Records moved to dead_letter_records because they failed to flatten or write.",
+}
+
+# Histogram buckets in seconds
+HISTOGRAMS = {
+    "whoop_http_request_seconds": ("Latency of WHOOP API requests.",
+                                   (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)),
+    "whoop_json_decode_seconds": ("Time to decode one WHOOP API response body.",
+                                  (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1)),
+    "whoop_db_write_seconds": ("Time to write one batch with BulkWriter.",
+                               (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms for one scope, e.g. the whole process or a single job.
+
+    A registry created with a parent also records everything into the parent, so a job
+    can keep its own totals while the process-wide registry behind /metrics keeps growing.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter."""
+        if name not in COUNTERS:
+            raise KeyError(f"Unknown counter: {name}")
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        if self.parent is not None:
+            self.parent.inc(name, amount, **labels)
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram."""
+        buckets = HISTOGRAMS[name][1]
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0, "max": 0.0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+            histogram["max"] = max(histogram["max"], value)
+        if self.parent is not None:
+            self.parent.observe(name, value, **labels)
+
+    def record_write(self, result):
+        """Record a BulkWriter.write result."""
+        self.inc("whoop_rows_written_total", result["rows"], table=result["table"], mode=result["mode"])
+        if result.get("skipped_unchanged"):
+            self.inc("whoop_rows_skipped_total", result["skipped_unchanged"], table=result["table"])
+        self.observe("whoop_db_write_seconds", result["seconds"], table=result["table"])
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._histograms.items()}
+
+        lines = []
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """JSON-friendly totals: counters per label set, and count/sum/mean/max per histogram."""
+        def label_text(labels):
+            return ",".join(f"{name}={value}" for name, value in labels) or "total"
+
+        with self._lock:
+            summary = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                summary.setdefault(name, {})[label_text(labels)] = value
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                summary.setdefault(name, {})[label_text(labels)] = {
+                    "count": histogram["count"],
+                    "sum": round(histogram["sum"], 3),
+                    "mean": round(histogram["sum"] / histogram["count"], 4) if histogram["count"] else None,
+                    "max": round(histogram["max"], 3),
+                }
+        return summary
+
+
+# Process-wide registry served by the Flask /metrics route
+METRICS = MetricsRegistry()
@@ -0,0 +1,330 @@
+import argparse
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from whoop_sync import parse_timestamp
+
+# Records generated per day for each collection endpoint (path under /developer)
+COLLECTIONS = {
+    "v1/cycle": "cycle",
+    "v1/recovery": "recovery",
+    "v1/activity/sleep": "sleep",
+    "v1/activity/workout": "workout",
+}
+
+
+class MockSettings:
+    """Shape of the synthetic data and the faults the mock injects."""
+
+    def __init__(self, days=365, end_date=None, workouts_per_day=1, page_size=25, latency_ms=0.0,
+                 throttle_rate=0.0, retry_after=0, seed=7):
+        self.days = days
+        self.end_date = end_date or datetime.now(timezone.utc).date()
+        self.workouts_per_day = workouts_per_day
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        # Share of collection requests answered with 429, with Retry-After when retry_after > 0
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+
+    @property
+    def first_date(self):
+        return self.end_date - timedelta(days=self.days - 1)
+
+
+def _iso(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+class SyntheticData:
+    """
+    Deterministic WHOOP-shaped records: one cycle, recovery and sleep per day and
+    workouts_per_day workouts, newest first like the real API. Records are built
+    on demand per page, so large histories cost no memory.
+    """
+
+    # Hour of day each collection's records start at
+    START_HOURS = {"cycle": 4, "recovery": 4, "sleep": 22, "workout": 17}
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def per_day(self, collection):
+        return self.settings.workouts_per_day if collection == "workout" else 1
+
+    def _start(self, collection, day, slot):
+        date = self.settings.first_date + timedelta(days=day)
+        hour = self.START_HOURS[collection] + slot
+        return datetime(date.year, date.month, date.day, tzinfo=timezone.utc) + timedelta(hours=hour)
+
+    def keys(self, collection, start=None, end=None):
+        """(day, slot) of every record inside [start, end), newest first."""
+        keys = []
+        for day in range(self.settings.days - 1, -1, -1):
+            for slot in range(self.per_day(collection) - 1, -1, -1):
+                began = self._start(collection, day, slot)
+                if (start is None or began >= start) and (end is None or began < end):
+                    keys.append((day, slot))
+        return keys
+
+    def record(self, collection, user_id, day, slot):
+        rng = random.Random(f"{self.settings.seed}:{user_id}:{collection}:{day}:{slot}")
+        began = self._start(collection, day, slot)
+        record_id = (int(user_id) * 100000 + day) * 10 + slot
+        created_at = _iso(began + timedelta(hours=1))
+
+        if collection == "cycle":
+            return {
+                "id": record_id, "user_id": user_id, "created_at": created_at, "updated_at": created_at,
+                "start": _iso(began), "end": _iso(began + timedelta(days=1)), "timezone_offset": "+00:00",
+                "score_state": "SCORED",
+                "score": {
+                    "strain": round(rng.uniform(4, 20), 4), "kilojoule": round(rng.uniform(6000, 16000), 2),
+                    "average_heart_rate": rng.randint(55, 80), "max_heart_rate": rng.randint(140, 195),
+                },
+            }
+        if collection == "recovery":
+            return {
+                "cycle_id": record_id, "sleep_id": record_id, "user_id": user_id,
+                "created_at": _iso(began), "updated_at": created_at, "score_state": "SCORED",
+                "score": {
+                    "user_calibrating": False, "recovery_score": rng.randint(20, 99),
+                    "resting_heart_rate": rng.randint(42, 70), "hrv_rmssd_milli": round(rng.uniform(20, 140), 3),
+                    "spo2_percentage": round(rng.uniform(94, 99), 2), "skin_temp_celsius": round(rng.uniform(32, 35), 2),
+                },
+            }
+        if collection == "sleep":
+            in_bed = rng.randint(5 * 3600000, 9 * 3600000)
+            return {
+                "id": record_id, "user_id": user_id, "created_at": created_at, "updated_at": created_at,
+                "start": _iso(began), "end": _iso(began + timedelta(milliseconds=in_bed)),
+                "timezone_offset": "+00:00", "nap": False, "score_state": "SCORED",
+                "score": {
+                    "stage_summary": {
+                        "total_in_bed_time_milli": in_bed,
+                        "total_awake_time_milli": in_bed // 12,
+                        "total_light_sleep_time_milli": in_bed // 2,
+                        "total_slow_wave_sleep_time_milli": in_bed // 6,
+                        "total_rem_sleep_time_milli": in_bed // 5,
+                        "sleep_cycle_count": rng.randint(3, 6),
+                        "disturbance_count": rng.randint(0, 20),
+                    },
+                    "respiratory_rate": round(rng.uniform(12, 18), 4),
+                    "sleep_performance_percentage": rng.randint(50, 100),
+                    "sleep_efficiency_percentage": round(rng.uniform(75, 98), 4),
+                },
+            }
+        return {
+            "id": record_id, "user_id": user_id, "created_at": created_at, "updated_at": created_at,
+            "start": _iso(began), "end": _iso(began + timedelta(minutes=45)), "timezone_offset": "+00:00",
+            "sport_id": rng.randint(0, 100), "score_state": "SCORED",
+            "score": {
+                "strain": round(rng.uniform(2, 18), 4), "kilojoule": round(rng.uniform(500, 4000), 2),
+                "average_heart_rate": rng.randint(100, 160), "max_heart_rate": rng.randint(150, 195),
+                "percent_recorded": 100.0, "distance_meter": round(rng.uniform(0, 15000), 2),
+                "altitude_gain_meter": round(rng.uniform(0, 300), 2), "altitude_change_meter": round(rng.uniform(-50, 50), 2),
+            },
+        }
+
+
+def _window(args):
+    """The [start, end) filter of a collection request, sent as start/end or inside the client's filter param."""
+    params = dict(args)
+    params.update(parse_qsl(args.get("filter", "")))
+    bounds = []
+    for name in ("start", "end"):
+        value = parse_timestamp(params.get(name))
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        bounds.append(value)
+    return bounds
+
+
+def create_app(settings):
+    """Flask app that mimics the WHOOP OAuth and developer API endpoints the ingest uses."""
+    app = Flask(__name__)
+    data = SyntheticData(settings)
+    rng = random.Random(settings.seed)
+    users = {}
+    lock = threading.Lock()
+    stats = {"requests": 0, "throttled": 0, "records": 0, "tokens": 0}
+    app.config["MOCK_STATS"] = stats
+
+    def count(key, amount=1):
+        with lock:
+            stats[key] += amount
+
+    def user_for(username):
+        with lock:
+            return users.setdefault(username or "", 10001 + len(users))
+
+    def current_user():
+        # Tokens are "<user_id>.<random>", so requests can be tied back to their account
+        auth = request.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        user_id, _, _ = token.partition(".")
+        return int(user_id) if user_id.isdigit() else None
+
+    @app.before_request
+    def simulate_latency():
+        count("requests")
+        if settings.latency_ms:
+            time.sleep(settings.latency_ms / 1000)
+
+    @app.route("/oauth/token", methods=["POST"])
+    def token():
+        body = request.get_json(silent=True) or request.form.to_dict()
+        if body.get("grant_type") == "refresh_token":
+            user_id, _, _ = str(body.get("refresh_token", "")).partition(".")
+            if not user_id.isdigit():
+                return jsonify({"error": "invalid_grant"}), 400
+            user_id = int(user_id)
+        else:
+            user_id = user_for(body.get("username"))
+        count("tokens")
+        return jsonify({
+            "access_token": f"{user_id}.{uuid.uuid4().hex}",
+            "refresh_token": f"{user_id}.{uuid.uuid4().hex}",
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "user": {"id": user_id},
+        })
+
+    @app.route("/developer/v1/user/profile/basic", methods=["GET"])
+    def profile():
+        user_id = current_user()
+        if user_id is None:
+            return jsonify({"error": "unauthorized"}), 401
+        return jsonify({
+            "user_id": user_id, "email": f"athlete{user_id}@example.com",
+            "first_name": "Mock", "last_name": f"Athlete {user_id}",
+        })
+
+    @app.route("/developer/v1/user/measurement/body", methods=["GET"])
+    def body():
+        if current_user() is None:
+            return jsonify({"error": "unauthorized"}), 401
+        return jsonify({"height_meter": 1.8, "weight_kilogram": 75.0, "max_heart_rate": 195})
+
+    @app.route("/developer/<path:endpoint>", methods=["GET"])
+    def collection(endpoint):
+        base, _, record_id = endpoint.rpartition("/")
+        if endpoint not in COLLECTIONS and base in COLLECTIONS and record_id.isdigit():
+            return single_record(COLLECTIONS[base], int(record_id))
+        name = COLLECTIONS.get(endpoint)
+        if name is None:
+            return jsonify({"error": f"unknown endpoint {endpoint}"}), 404
+        user_id = current_user()
+        if user_id is None:
+            return jsonify({"error": "unauthorized"}), 401
+        if settings.throttle_rate:
+            with lock:
+                throttled = rng.random() < settings.throttle_rate
+            if throttled:
+                count("throttled")
+                response = jsonify({"error": "too many requests"})
+                if settings.retry_after:
+                    response.headers["Retry-After"] = str(settings.retry_after)
+                return response, 429
+
+        start, end = _window(request.args)
+        keys = data.keys(name, start, end)
+        offset = int(request.args.get("next_token") or 0)
+        limit = min(int(request.args.get("limit") or settings.page_size), settings.page_size)
+        page = [data.record(name, user_id, day, slot) for day, slot in keys[offset:offset + limit]]
+        count("records", len(page))
+        next_offset = offset + limit
+        return jsonify({"records": page, "next_token": str(next_offset) if next_offset < len(keys) else None})
+
+    def single_record(name, record_id):
+        # Ids encode (user_id * 100000 + day) * 10 + slot, see SyntheticData.record
+        user_id = current_user()
+        if user_id is None:
+            return jsonify({"error": "unauthorized"}), 401
+        owner, day, slot = record_id // 1000000, record_id // 10 % 100000, record_id % 10
+        if owner != user_id or day >= settings.days or slot >= data.per_day(name):
+            return jsonify({"error": "not found"}), 404
+        count("records")
+        return jsonify(data.record(name, user_id, day, slot))
+
+    @app.route("/mock/stats", methods=["GET"])
+    def mock_stats():
+        with lock:
+            return jsonify(dict(stats))
+
+    return app
+
+
+class MockWhoopServer:
+    """Runs the mock API on a background thread, e.g. for the benchmark suite."""
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.settings = settings or MockSettings()
+        self.app = create_app(self.settings)
+        self._server = make_server(host, port, self.app, threaded=True)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self._server.host}:{self._server.port}"
+
+    @property
+    def stats(self):
+        return dict(self.app.config["MOCK_STATS"])
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="whoop-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of the WHOOP API with synthetic data.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--days", type=int, default=365, help="days of history per user")
+    parser.add_argument("--workouts-per-day", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=25, help="records per page (WHOOP allows 25)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of collection requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429s (0 omits it)")
+    return parser.parse_args(argv)
+
+
+def settings_from_args(args):
+    return MockSettings(
+        days=args.days, workouts_per_day=args.workouts_per_day, page_size=args.page_size,
+        latency_ms=args.latency_ms, throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = MockWhoopServer(settings_from_args(args), host=args.host, port=args.port)
+    print(f"Mock WHOOP API on {server.base_url} (AUTH_URL={server.base_url}, REQUEST_URL={server.base_url}/developer)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,100 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Store method on WhoopClient for each streamed collection
+STORE_METHODS = {
+    "cycle": "store_cycle_data",
+    "recovery": "store_recovery_data",
+    "sleep": "store_sleep_data",
+    "workout": "store_workout_data",
+}
+
+_DONE = object()  # Marks the end of one producer's pages
+
+
+def stream_collections(client, store_db, start_date=None, end_date=None, collections=None,
+                       max_workers=4, queue_size=8, windows=None, on_page=None):
+    """
+    Fetch collections page by page and store every page as soon as it arrives.
+
+    Producer threads crawl the collections and put (collection, page) items on a
+    bounded queue; the calling thread drains it into the matching store_* method.
+    At most queue_size pages are held in memory at any time, so memory stays flat
+    however long the date range is, and database writes overlap network waits.
+    Returns the number of records stored per collection, in STORE_METHODS order.
+
+    windows optionally maps a collection to its own (start_date, end_date), and
+    on_page(collection, page, stored) is called after every page is written.
+    """
+    collections = list(collections or windows or STORE_METHODS)
+    windows = windows or {}
+    tasks = [(name,) + tuple(windows.get(name, (start_date, end_date))) for name in collections]
+    return stream_tasks(client, store_db, tasks, max_workers=max_workers, queue_size=queue_size,
+                        on_page=on_page)
+
+
+def stream_tasks(client, store_db, tasks, max_workers=4, queue_size=8, before_store=None, on_page=None):
+    """
+    Crawl (collection, start_date, end_date) tasks in parallel and store their pages as they arrive.
+
+    This is the engine behind stream_collections; several tasks may target the same
+    collection (e.g. date shards). before_store(collection, page) may return a filtered
+    page before it is written. Returns the number of records stored per collection;
+    pages whose store method returned False are not counted.
+    """
+    pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    counts = {name: 0 for name, _start, _end in tasks}
+
+    def produce(name, start, end):
+        try:
+            if stop.is_set():
+                return
+            for page in client.iter_collection_pages(name, start, end):
+                if not _put(pages, (name, page), stop):
+                    return
+        finally:
+            _put(pages, (name, _DONE), stop)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(produce, *task) for task in tasks]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                name, page = pages.get()
+                if page is _DONE:
+                    remaining -= 1
+                    continue
+                if before_store:
+                    page = before_store(name, page)
+                    if not page:
+                        continue
+                logging.info(f"Storing page of {len(page)} {name} records...")
+                stored = getattr(client, STORE_METHODS[name])(page, store_db)
+                if stored:
+                    # A page that failed to store is reported through on_page, not counted
+                    counts[name] += len(page)
+                if on_page:
+                    on_page(name, page, stored)
+        finally:
+            # Unblock producers if the writer stopped early
+            stop.set()
+
+        # Surface the first fetch error, if any
+        for future in futures:
+            future.result()
+
+    return counts
+
+
+def _put(pages, item, stop):
+    """Put an item on the bounded queue unless the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
@@ -0,0 +1,82 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every request a client (or a whole multi-account run) makes.
+
+    The fill rate starts at `rate` requests/sec. A 429 halves it and, when the response
+    carries Retry-After, pauses all callers until that moment. Each success then adds a
+    small step back, so throughput climbs back towards the allowed rate instead of idling.
+    """
+
+    def __init__(self, rate, burst=5, min_rate=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until the caller may send one request."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                self.wait_seconds += wait
+            time.sleep(wait)
+
+    def on_success(self):
+        """Additively recover the rate after a successful request."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_throttled(self, retry_after=None):
+        """Halve the rate after a 429 and honour the server's Retry-After, if any."""
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logging.warning(f"WHOOP API throttled the client; rate lowered to {self.rate:.2f} req/s"
+                        + (f", pausing {retry_after:.1f}s" if retry_after else ""))
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
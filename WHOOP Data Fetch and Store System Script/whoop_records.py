@@ -0,0 +1,166 @@
+import json
+
+from whoop_db import CYCLE_DATA, RECOVERY_DATA, SLEEP_DATA, WORKOUT_DATA
+
+try:
+    import orjson  # Optional, noticeably faster at decoding large pages
+except ImportError:
+    orjson = None
+
+# Marks a column filled from the client's user_id rather than from the record
+USER_ID = object()
+
+
+class Field:
+    """One output column: a dotted path into the API record, a default and an optional transform."""
+
+    def __init__(self, path, default=None, transform=None):
+        self.path = path
+        self.default = default
+        self.transform = transform
+
+
+def milli_to_minutes(value):
+    """Whole minutes from a WHOOP *_milli duration."""
+    return value // 60000 if value is not None else None
+
+
+def decode_json(content):
+    """Decode an API response body, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class RecordFlattener:
+    """
+    Turns pages of WHOOP records into rows for one table, following a declarative field mapping.
+
+    The mapping is compiled once into a generated function that reads every nested
+    object (e.g. score.stage_summary) a single time per record and builds the row
+    tuple in column order, ready for BulkWriter.
+    """
+
+    def __init__(self, table, fields):
+        self.table = table
+        self.fields = dict(fields)
+        missing = [column for column in table.columns if column not in self.fields]
+        if missing:
+            raise ValueError(f"No field mapping for {table.name} columns: {missing}")
+        self._extract = self._compile()
+
+    def _compile(self):
+        namespace = {"_EMPTY": {}}
+        parents = {(): "record"}
+        lines = []
+        values = []
+
+        def parent_of(keys):
+            # Bind each nested object to a local once, falling back to {} when it is missing or null
+            if keys not in parents:
+                outer = parent_of(keys[:-1])
+                name = "_" + "_".join(keys)
+                lines.append(f"        {name} = {outer}.get({keys[-1]!r}) or _EMPTY")
+                parents[keys] = name
+            return parents[keys]
+
+        for index, column in enumerate(self.table.columns):
+            field = self.fields[column]
+            if field is USER_ID:
+                values.append("user_id")
+                continue
+            if isinstance(field, str):
+                field = Field(field)
+            *outer, key = field.path.split(".")
+            namespace[f"_default{index}"] = field.default
+            value = f"{parent_of(tuple(outer))}.get({key!r}, _default{index})"
+            if field.transform is not None:
+                namespace[f"_transform{index}"] = field.transform
+                value = f"_transform{index}({value})"
+            values.append(value)
+
+        source = "\n".join([
+            "def extract(records, user_id):",
+            "    rows = []",
+            "    append = rows.append",
+            "    for record in records:",
+            *lines,
+            f"        append(({', '.join(values)},))",
+            "    return rows",
+        ])
+        exec(compile(source, f"<flattener {self.table.name}>", "exec"), namespace)
+        return namespace["extract"]
+
+    def rows(self, records, user_id):
+        """One tuple per record, laid out in the table's column order."""
+        return self._extract(records, user_id)
+
+    def columns(self, records, user_id):
+        """The same values as rows(), transposed into one list per column."""
+        rows = self._extract(records, user_id)
+        if not rows:
+            return {column: [] for column in self.table.columns}
+        return dict(zip(self.table.columns, map(list, zip(*rows))))
+
+
+CYCLE_RECORDS = RecordFlattener(CYCLE_DATA, {
+    "cycle_id": "id",
+    "user_id": USER_ID,
+    "strain": "score.strain",
+    "kilojoule": "score.kilojoule",
+    "average_heart_rate": "score.average_heart_rate",
+    "max_heart_rate": "score.max_heart_rate",
+    "created_at": "created_at",
+})
+
+RECOVERY_RECORDS = RecordFlattener(RECOVERY_DATA, {
+    "cycle_id": "cycle_id",
+    "sleep_id": "sleep_id",
+    "user_id": USER_ID,
+    "score_state": "score_state",
+    "recovery_score": "score.recovery_score",
+    "resting_heart_rate": "score.resting_heart_rate",
+    "hrv_rmssd_milli": "score.hrv_rmssd_milli",
+    "spo2_percentage": "score.spo2_percentage",
+    "skin_temp_celsius": "score.skin_temp_celsius",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+})
+
+SLEEP_RECORDS = RecordFlattener(SLEEP_DATA, {
+    "sleep_id": "id",
+    "user_id": USER_ID,
+    "total_sleep_time": Field("score.stage_summary.total_in_bed_time_milli", 0, milli_to_minutes),
+    "rem_sleep_time": Field("score.stage_summary.total_rem_sleep_time_milli", 0, milli_to_minutes),
+    "deep_sleep_time": Field("score.stage_summary.total_slow_wave_sleep_time_milli", 0, milli_to_minutes),
+    "efficiency": "score.sleep_efficiency_percentage",
+    "timestamp": "start",
+    "disturbance_count": Field("score.stage_summary.disturbance_count", 0),
+    "light_sleep_time": Field("score.stage_summary.total_light_sleep_time_milli", 0, milli_to_minutes),
+    "nap": "nap",
+    "respiratory_rate": "score.respiratory_rate",
+})
+
+WORKOUT_RECORDS = RecordFlattener(WORKOUT_DATA, {
+    "workout_id": "id",
+    "user_id": USER_ID,
+    "start": "start",
+    "end_time": "end",
+    "strain": "score.strain",
+    "kilojoule": "score.kilojoule",
+    "average_heart_rate": "score.average_heart_rate",
+    "max_heart_rate": "score.max_heart_rate",
+    "percent_recorded": "score.percent_recorded",
+    "distance_meter": Field("score.distance_meter", 0),
+    "altitude_gain_meter": Field("score.altitude_gain_meter", 0),
+    "altitude_change_meter": Field("score.altitude_change_meter", 0),
+    "created_at": "created_at",
+})
+
+# Flattener per collection name, as used by the store methods and the pipelines
+FLATTENERS = {
+    "cycle": CYCLE_RECORDS,
+    "recovery": RECOVERY_RECORDS,
+    "sleep": SLEEP_RECORDS,
+    "workout": WORKOUT_RECORDS,
+}
@@ -0,0 +1,168 @@
+import logging
+from datetime import date, datetime, timedelta
+
+from whoop_db import borrow_connection
+from whoop_sync import parse_timestamp
+
+# One row per user and UTC day, rebuilt from the collection tables for the days a run touched
+DAILY_SUMMARY_DDL = """
+    CREATE TABLE IF NOT EXISTS daily_health_summary (
+        user_id VARCHAR NOT NULL,
+        day DATE NOT NULL,
+        strain FLOAT,
+        kilojoule FLOAT,
+        average_heart_rate FLOAT,
+        max_heart_rate INT,
+        recovery_score FLOAT,
+        hrv_rmssd_milli FLOAT,
+        resting_heart_rate FLOAT,
+        total_sleep_time INT,
+        rem_sleep_time INT,
+        deep_sleep_time INT,
+        light_sleep_time INT,
+        sleep_efficiency FLOAT,
+        respiratory_rate FLOAT,
+        nap_count INT,
+        workout_count INT,
+        workout_strain FLOAT,
+        workout_kilojoule FLOAT,
+        workout_distance_meter FLOAT,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (user_id, day)
+    )
+"""
+
+# Each table contributes to the day of its time column: cycles and recoveries by created_at,
+# sleeps by their start timestamp and workouts by start. Naps count separately from the main sleep.
+REFRESH_SQL = """
+    WITH days AS (
+        SELECT unnest(%(days)s::date[]) AS day
+    ),
+    cycles AS (
+        SELECT created_at::date AS day, avg(strain) AS strain, sum(kilojoule) AS kilojoule,
+               avg(average_heart_rate) AS average_heart_rate, max(max_heart_rate) AS max_heart_rate
+        FROM cycle_data
+        WHERE user_id = %(user_id)s AND created_at >= %(first)s AND created_at < %(last)s
+          AND created_at::date = ANY(%(days)s::date[])
+        GROUP BY 1
+    ),
+    recoveries AS (
+        SELECT created_at::date AS day, avg(recovery_score) AS recovery_score,
+               avg(hrv_rmssd_milli) AS hrv_rmssd_milli, avg(resting_heart_rate) AS resting_heart_rate
+        FROM recovery_data
+        WHERE user_id = %(user_id)s AND created_at >= %(first)s AND created_at < %(last)s
+          AND created_at::date = ANY(%(days)s::date[])
+        GROUP BY 1
+    ),
+    sleeps AS (
+        SELECT timestamp::date AS day,
+               sum(total_sleep_time) FILTER (WHERE NOT coalesce(nap, false)) AS total_sleep_time,
+               sum(rem_sleep_time) FILTER (WHERE NOT coalesce(nap, false)) AS rem_sleep_time,
+               sum(deep_sleep_time) FILTER (WHERE NOT coalesce(nap, false)) AS deep_sleep_time,
+               sum(light_sleep_time) FILTER (WHERE NOT coalesce(nap, false)) AS light_sleep_time,
+               avg(efficiency) FILTER (WHERE NOT coalesce(nap, false)) AS sleep_efficiency,
+               avg(respiratory_rate) FILTER (WHERE NOT coalesce(nap, false)) AS respiratory_rate,
+               count(*) FILTER (WHERE nap) AS nap_count
+        FROM sleep_data
+        WHERE user_id = %(user_id)s AND timestamp >= %(first)s AND timestamp < %(last)s
+          AND timestamp::date = ANY(%(days)s::date[])
+        GROUP BY 1
+    ),
+    workouts AS (
+        SELECT start::date AS day, count(*) AS workout_count, sum(strain) AS workout_strain,
+               sum(kilojoule) AS workout_kilojoule, sum(distance_meter) AS workout_distance_meter
+        FROM workout_data
+        WHERE user_id = %(user_id)s AND start >= %(first)s AND start < %(last)s
+          AND start::date = ANY(%(days)s::date[])
+        GROUP BY 1
+    )
+    INSERT INTO daily_health_summary (
+        user_id, day, strain, kilojoule, average_heart_rate, max_heart_rate,
+        recovery_score, hrv_rmssd_milli, resting_heart_rate,
+        total_sleep_time, rem_sleep_time, deep_sleep_time, light_sleep_time, sleep_efficiency,
+        respiratory_rate, nap_count, workout_count, workout_strain, workout_kilojoule, workout_distance_meter
+    )
+    SELECT %(user_id)s, days.day, c.strain, c.kilojoule, c.average_heart_rate, c.max_heart_rate,
+           r.recovery_score, r.hrv_rmssd_milli, r.resting_heart_rate,
+           s.total_sleep_time, s.rem_sleep_time, s.deep_sleep_time, s.light_sleep_time, s.sleep_efficiency,
+           s.respiratory_rate, coalesce(s.nap_count, 0), coalesce(w.workout_count, 0),
+           w.workout_strain, w.workout_kilojoule, w.workout_distance_meter
+    FROM days
+    LEFT JOIN cycles c USING (day)
+    LEFT JOIN recoveries r USING (day)
+    LEFT JOIN sleeps s USING (day)
+    LEFT JOIN workouts w USING (day)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        strain = EXCLUDED.strain, kilojoule = EXCLUDED.kilojoule,
+        average_heart_rate = EXCLUDED.average_heart_rate, max_heart_rate = EXCLUDED.max_heart_rate,
+        recovery_score = EXCLUDED.recovery_score, hrv_rmssd_milli = EXCLUDED.hrv_rmssd_milli,
+        resting_heart_rate = EXCLUDED.resting_heart_rate, total_sleep_time = EXCLUDED.total_sleep_time,
+        rem_sleep_time = EXCLUDED.rem_sleep_time, deep_sleep_time = EXCLUDED.deep_sleep_time,
+        light_sleep_time = EXCLUDED.light_sleep_time, sleep_efficiency = EXCLUDED.sleep_efficiency,
+        respiratory_rate = EXCLUDED.respiratory_rate, nap_count = EXCLUDED.nap_count,
+        workout_count = EXCLUDED.workout_count, workout_strain = EXCLUDED.workout_strain,
+        workout_kilojoule = EXCLUDED.workout_kilojoule, workout_distance_meter = EXCLUDED.workout_distance_meter,
+        updated_at = now()
+"""
+
+# Every (user, day) with data, used to fill a newly created summary table
+ALL_DAYS_SQL = """
+    SELECT user_id, created_at::date FROM cycle_data WHERE created_at IS NOT NULL
+    UNION SELECT user_id, created_at::date FROM recovery_data WHERE created_at IS NOT NULL
+    UNION SELECT user_id, timestamp::date FROM sleep_data WHERE timestamp IS NOT NULL
+    UNION SELECT user_id, start::date FROM workout_data WHERE start IS NOT NULL
+"""
+
+
+def days_of(table, rows):
+    """UTC days covered by rows of a collection table, taken from its time column."""
+    index = table.columns.index(table.time_column)
+    days = set()
+    for row in rows:
+        value = row[index]
+        if isinstance(value, str):
+            value = parse_timestamp(value)
+        if isinstance(value, datetime):
+            days.add(value.date())
+        elif isinstance(value, date):
+            days.add(value)
+    return days
+
+
+def refresh_days(cursor, user_id, days):
+    """Recompute the summary rows of one user for the given days. Returns how many days were refreshed."""
+    days = sorted(days)
+    if not days:
+        return 0
+    cursor.execute(REFRESH_SQL, {
+        "user_id": str(user_id),
+        "days": days,
+        "first": days[0],
+        "last": days[-1] + timedelta(days=1),
+    })
+    return len(days)
+
+
+def ensure_daily_summary(cursor):
+    """Create daily_health_summary if needed, filling it from the existing history the first time."""
+    cursor.execute("SELECT to_regclass('daily_health_summary')")
+    if cursor.fetchone()[0] is not None:
+        return
+    cursor.execute(DAILY_SUMMARY_DDL)
+    cursor.execute(ALL_DAYS_SQL)
+    by_user = {}
+    for user_id, day in cursor.fetchall():
+        by_user.setdefault(user_id, set()).add(day)
+    for user_id, days in by_user.items():
+        refresh_days(cursor, user_id, days)
+    logging.info(f"Created daily_health_summary for {len(by_user)} users.")
+
+
+def refresh_daily_summary(db, user_id, days):
+    """Recompute the touched days of a user through anything borrow_connection accepts."""
+    if not days:
+        return 0
+    with borrow_connection(db) as conn, conn.cursor() as cursor:
+        refreshed = refresh_days(cursor, user_id, days)
+    logging.info(f"Refreshed {refreshed} days of daily_health_summary for user {user_id}.")
+    return refreshed
@@ -0,0 +1,300 @@
+import argparse
+import json
+import logging
+from datetime import date
+
+from psycopg2 import sql
+
+from whoop_db import COLLECTION_TABLES, IngestDatabase, borrow_connection
+from whoop_dead_letter import ensure_dead_letter_table
+from whoop_rollup import ensure_daily_summary
+
+SLEEP_KEY_INDEX = "sleep_data_user_id_timestamp_key"
+
+# Column types of the collection tables, used when they are created from scratch
+COLUMN_TYPES = {
+    "cycle_data": {
+        "cycle_id": "VARCHAR", "user_id": "VARCHAR", "strain": "FLOAT", "kilojoule": "FLOAT",
+        "average_heart_rate": "INT", "max_heart_rate": "INT", "created_at": "TIMESTAMP",
+    },
+    "recovery_data": {
+        "cycle_id": "VARCHAR", "sleep_id": "VARCHAR", "user_id": "VARCHAR", "score_state": "VARCHAR",
+        "recovery_score": "FLOAT", "resting_heart_rate": "FLOAT", "hrv_rmssd_milli": "FLOAT",
+        "spo2_percentage": "FLOAT", "skin_temp_celsius": "FLOAT", "created_at": "TIMESTAMP",
+        "updated_at": "TIMESTAMP",
+    },
+    "sleep_data": {
+        "sleep_id": "VARCHAR", "user_id": "VARCHAR", "total_sleep_time": "INT", "rem_sleep_time": "INT",
+        "deep_sleep_time": "INT", "efficiency": "FLOAT", "timestamp": "TIMESTAMP", "disturbance_count": "INT",
+        "light_sleep_time": "INT", "nap": "BOOLEAN", "respiratory_rate": "FLOAT",
+    },
+    "workout_data": {
+        "workout_id": "VARCHAR", "user_id": "VARCHAR", "start": "TIMESTAMP", "end_time": "TIMESTAMP",
+        "strain": "FLOAT", "kilojoule": "FLOAT", "average_heart_rate": "FLOAT", "max_heart_rate": "FLOAT",
+        "percent_recorded": "FLOAT", "distance_meter": "FLOAT", "altitude_gain_meter": "FLOAT",
+        "altitude_change_meter": "FLOAT", "created_at": "TIMESTAMP",
+    },
+}
+
+# Monthly partitions kept attached beyond the current month
+PARTITION_MONTHS_AHEAD = 3
+
+
+def migrate_sleep_data(cursor):
+    """
+    Give sleep_data a natural key so sleep ingestion is idempotent.
+
+    Adds the WHOOP sleep_id column, deletes rows duplicated by earlier re-runs
+    (same user_id and timestamp, keeping the first one) and creates the unique
+    (user_id, timestamp) index the store method conflicts on. The dedup pass only
+    runs while the unique index is missing. Returns the number of rows removed.
+    """
+    if _table_kind(cursor, "sleep_data") is None:
+        return 0
+    cursor.execute("ALTER TABLE sleep_data ADD COLUMN IF NOT EXISTS sleep_id VARCHAR")
+    cursor.execute(
+        "SELECT 1 FROM pg_indexes WHERE tablename = 'sleep_data' AND indexname = %s",
+        (SLEEP_KEY_INDEX,)
+    )
+    if cursor.fetchone():
+        return 0
+
+    cursor.execute("""
+        DELETE FROM sleep_data newer
+        USING sleep_data older
+        WHERE newer.user_id = older.user_id
+          AND newer.timestamp = older.timestamp
+          AND newer.ctid > older.ctid
+    """)
+    removed = cursor.rowcount
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {SLEEP_KEY_INDEX} ON sleep_data (user_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS sleep_data_sleep_id_idx ON sleep_data (sleep_id)")
+    logging.info(f"Migrated sleep_data: removed {removed} duplicate rows and added a unique (user_id, timestamp) index.")
+    return removed
+
+
+def _table_kind(cursor, name):
+    """pg_class.relkind of a table in the current schema: "r" plain, "p" partitioned, None missing."""
+    cursor.execute("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = %s AND n.nspname = current_schema()
+    """, (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _default_partition(table):
+    return f"{table.name}_default"
+
+
+def _key_index(table):
+    return SLEEP_KEY_INDEX if table.name == "sleep_data" else f"{table.name}_natural_key"
+
+
+def _create_indexes(cursor, table):
+    """Unique natural key (partition column included) and the (user_id, time) index queries filter on."""
+    cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+        sql.Identifier(_key_index(table)), sql.Identifier(table.name),
+        sql.SQL(", ").join(map(sql.Identifier, table.conflict_columns))
+    ))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (user_id, {})").format(
+        sql.Identifier(f"{table.name}_user_time_idx"), sql.Identifier(table.name), sql.Identifier(table.time_column)
+    ))
+
+
+def _create_partitioned(cursor, table, like=None):
+    """Create the partitioned parent (copying the columns of `like` when given) and its default partition."""
+    if like:
+        columns = sql.SQL("LIKE {} INCLUDING DEFAULTS").format(sql.Identifier(like))
+    else:
+        columns = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(column), sql.SQL(COLUMN_TYPES[table.name][column]))
+            for column in table.columns
+        )
+    cursor.execute(sql.SQL("CREATE TABLE {} ({}) PARTITION BY RANGE ({})").format(
+        sql.Identifier(table.name), columns, sql.Identifier(table.time_column)
+    ))
+    # Catches rows outside every monthly partition (e.g. a missing timestamp) until a partition is attached
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+        sql.Identifier(_default_partition(table)), sql.Identifier(table.name)
+    ))
+    _create_indexes(cursor, table)
+
+
+def _convert_to_partitioned(cursor, table):
+    """
+    Move a plain table's rows into a new partitioned table of the same name.
+    The old table is kept as <name>_legacy (with its indexes renamed) until it is dropped by hand.
+    """
+    legacy = f"{table.name}_legacy"
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table.name), sql.Identifier(legacy)))
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (legacy,))
+    for (index,) in cursor.fetchall():
+        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+            sql.Identifier(index), sql.Identifier(f"legacy_{index}"[:63])
+        ))
+
+    _create_partitioned(cursor, table, like=legacy)
+    cursor.execute(sql.SQL("SELECT min({col}), max({col}) FROM {}").format(
+        sql.Identifier(legacy), col=sql.Identifier(table.time_column)
+    ))
+    oldest, newest = cursor.fetchone()
+    if oldest is not None:
+        ensure_partitions(cursor, table, _month_start(oldest), _month_start(newest))
+    cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM {} ON CONFLICT DO NOTHING").format(
+        sql.Identifier(table.name), sql.Identifier(legacy)
+    ))
+    logging.info(f"Partitioned {table.name}: copied {cursor.rowcount} rows; the old table is kept as {legacy}.")
+
+
+def _attach_partition(cursor, table, month):
+    """Attach the partition for one month, moving any of its rows out of the default partition first."""
+    name = f"{table.name}_{month:%Y_%m}"
+    if _table_kind(cursor, name) is not None:
+        return False
+    upper = _next_month(month)
+    cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+        sql.Identifier(name), sql.Identifier(table.name)
+    ))
+    cursor.execute(sql.SQL("""
+        WITH moved AS (DELETE FROM {default} WHERE {col} >= %s AND {col} < %s RETURNING *)
+        INSERT INTO {} SELECT * FROM moved
+    """).format(
+        sql.Identifier(name), default=sql.Identifier(_default_partition(table)), col=sql.Identifier(table.time_column)
+    ), (month, upper))
+    cursor.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+        sql.Identifier(table.name), sql.Identifier(name),
+        sql.Literal(month.isoformat()), sql.Literal(upper.isoformat())
+    ))
+    return True
+
+
+def _months_ahead(months_ahead):
+    """First day of the month months_ahead months after the current one."""
+    month = _month_start(date.today())
+    for _ in range(months_ahead):
+        month = _next_month(month)
+    return month
+
+
+def ensure_partitions(cursor, table, first_month, last_month):
+    """Attach every missing monthly partition from first_month to last_month. Returns how many were added."""
+    # One lookup of the attached partitions, so the common case of nothing missing stays cheap
+    cursor.execute("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_namespace n ON n.oid = parent.relnamespace
+        WHERE parent.relname = %s AND n.nspname = current_schema()
+    """, (table.name,))
+    attached = {row[0] for row in cursor.fetchall()}
+    added = 0
+    month = _month_start(first_month)
+    while month <= last_month:
+        if f"{table.name}_{month:%Y_%m}" not in attached:
+            added += _attach_partition(cursor, table, month)
+        month = _next_month(month)
+    return added
+
+
+def ensure_sync_partitions(db, first_day, months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Attach the monthly partitions from first_day (the start of a sync window, as a date or
+    "YYYY-MM-DD") to months_ahead months past the current one, before any row is stored,
+    so new rows land in their own partition instead of the default one.
+    Returns how many were added.
+    """
+    if isinstance(first_day, str):
+        first_day = date.fromisoformat(first_day[:10])
+    last_month = _months_ahead(months_ahead)
+    added = 0
+    with borrow_connection(db) as conn, conn.cursor() as cursor:
+        for table in COLLECTION_TABLES:
+            added += ensure_partitions(cursor, table, _month_start(first_day), last_month)
+    if added:
+        logging.info(f"Attached {added} monthly partitions from {first_day:%Y-%m} onwards.")
+    return added
+
+
+def migrate_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Keep the collection tables range-partitioned by month.
+
+    Missing tables are created partitioned and plain tables are converted once. Partitions
+    are then attached from the current month to months_ahead months ahead, and history that
+    landed in the default partition (e.g. from a backfill) gets its own monthly partitions.
+    """
+    today = date.today()
+    last_month = _months_ahead(months_ahead)
+
+    for table in COLLECTION_TABLES:
+        kind = _table_kind(cursor, table.name)
+        if kind is None:
+            _create_partitioned(cursor, table)
+            logging.info(f"Created partitioned table {table.name}.")
+        elif kind != "p":
+            _convert_to_partitioned(cursor, table)
+
+        added = ensure_partitions(cursor, table, _month_start(today), last_month)
+        cursor.execute(sql.SQL(
+            "SELECT DISTINCT date_trunc('month', {}) FROM {} WHERE {} IS NOT NULL"
+        ).format(
+            sql.Identifier(table.time_column), sql.Identifier(_default_partition(table)),
+            sql.Identifier(table.time_column)
+        ))
+        for (month,) in cursor.fetchall():
+            added += _attach_partition(cursor, table, _month_start(month))
+        _create_indexes(cursor, table)
+        if added:
+            logging.info(f"Attached {added} monthly partitions to {table.name}.")
+
+
+def migrate_hash_columns(cursor):
+    """
+    Add the content hash column upserts compare against to every keyed collection table.
+    ALTER TABLE locks the table, so it only runs when the column is actually missing.
+    """
+    for table in COLLECTION_TABLES:
+        if not table.can_upsert:
+            continue
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """, (table.name, table.HASH_COLUMN))
+        if cursor.fetchone():
+            continue
+        cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} CHAR(32)").format(
+            sql.Identifier(table.name), sql.Identifier(table.HASH_COLUMN)
+        ))
+        logging.info(f"Added {table.HASH_COLUMN} to {table.name}.")
+
+
+def migrate(db, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Apply the schema migrations the store methods rely on. Safe to run on every start."""
+    with borrow_connection(db) as conn, conn.cursor() as cursor:
+        migrate_sleep_data(cursor)
+        migrate_partitions(cursor, months_ahead)
+        migrate_hash_columns(cursor)
+        ensure_daily_summary(cursor)
+        ensure_dead_letter_table(cursor)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or migrate the WHOOP tables and attach upcoming partitions.")
+    parser.add_argument("--db-config", required=True, help="JSON file with psycopg2 connection settings (DB_CONFIG)")
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    with open(args.db_config, "r", encoding="utf-8") as config_file:
+        database = IngestDatabase(json.load(config_file), maxconn=1)
+    migrate(database, args.months_ahead)
+    database.close()
@@ -0,0 +1,277 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2 import sql
+
+try:
+    import duckdb
+except ImportError:  # DuckDB is only needed for STORAGE_BACKEND = "duckdb"
+    duckdb = None
+
+from whoop_db import COLLECTION_TABLES, borrow_connection
+from whoop_dead_letter import dead_letter, flatten_isolated, store_isolated
+from whoop_rollup import DAILY_SUMMARY_DDL
+from whoop_schema import COLUMN_TYPES
+from whoop_sync import SYNC_STATE_DDL
+
+
+def duckdb_type(column_type):
+    """A PostgreSQL column type in DuckDB, where FLOAT is a 4-byte REAL rather than double precision."""
+    return re.sub(r"\bFLOAT\b", "DOUBLE", column_type)
+
+
+# Tables the collection tables sit next to, in DuckDB's dialect
+DUCKDB_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id VARCHAR PRIMARY KEY,
+        first_name VARCHAR,
+        last_name VARCHAR,
+        email VARCHAR
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS body_measurements (
+        user_id VARCHAR PRIMARY KEY,
+        height_meter DOUBLE,
+        weight_kilogram DOUBLE,
+        max_heart_rate INT
+    )
+    """,
+    duckdb_type(DAILY_SUMMARY_DDL),
+    SYNC_STATE_DDL,
+    "CREATE SEQUENCE IF NOT EXISTS dead_letter_records_id",
+    """
+    CREATE TABLE IF NOT EXISTS dead_letter_records (
+        id BIGINT PRIMARY KEY DEFAULT nextval('dead_letter_records_id'),
+        table_name VARCHAR NOT NULL,
+        user_id VARCHAR,
+        record JSON,
+        error VARCHAR,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def render_composed(statement):
+    """Render a psycopg2 sql.Composable without a PostgreSQL connection, quoting identifiers DuckDB's way."""
+    if isinstance(statement, sql.Composed):
+        return "".join(render_composed(part) for part in statement.seq)
+    if isinstance(statement, sql.SQL):
+        return statement.string
+    if isinstance(statement, sql.Identifier):
+        return ".".join(map(_quote, statement.strings))
+    if isinstance(statement, sql.Placeholder):
+        return f"%({statement.name})s" if statement.name else "%s"
+    if isinstance(statement, sql.Literal):
+        value = statement.wrapped
+        if value is None:
+            return "NULL"
+        if isinstance(value, (bool, int, float)):
+            return str(value)
+        return "'" + str(value).replace("'", "''") + "'"
+    raise TypeError(f"Cannot render {type(statement).__name__} for DuckDB")
+
+
+def duckdb_statement(statement):
+    """Rewrite psycopg2 placeholders (%s, %(name)s) into DuckDB's (?, $name)."""
+    if isinstance(statement, sql.Composable):
+        statement = render_composed(statement)
+
+    def replace(match):
+        if match.group(1):
+            return f"${match.group(1)}"
+        return "?" if match.group(0) == "%s" else "%"
+    return _PLACEHOLDER.sub(replace, statement)
+
+
+class PostgresStorage:
+    """The PostgreSQL path: BulkWriter with savepoint isolation on anything borrow_connection accepts."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def store_records(self, bulk_writer, flattener, records, user_id):
+        """Flatten and store a page of API records. Returns the rows written."""
+        with borrow_connection(self.db) as conn:
+            return store_isolated(conn, bulk_writer, flattener, records, user_id)
+
+
+class DuckDBCursor:
+    """DB-API cursor over a DuckDB connection that accepts the psycopg2 placeholder style."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def description(self):
+        return self._conn.description
+
+    def execute(self, statement, params=None):
+        self._conn.execute(duckdb_statement(statement), params)
+
+    def executemany(self, statement, params):
+        self._conn.executemany(duckdb_statement(statement), params)
+
+    def fetchone(self):
+        return self._conn.fetchone()
+
+    def fetchall(self):
+        return self._conn.fetchall()
+
+
+class DuckDBConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return DuckDBCursor(self._conn)
+
+
+class DuckDBStorage:
+    """
+    Embedded, columnar storage in a local DuckDB file, for laptops and small deployments.
+
+    It can stand in wherever an IngestDatabase is accepted: connection() and run() let the
+    sync state, rollup and profile SQL run unchanged, and store_records replaces BulkWriter
+    with multi-row upserts. The chatbot can then query the same file in-process.
+    """
+
+    def __init__(self, path, upsert=True):
+        if duckdb is None:
+            raise RuntimeError("DuckDB storage needs the duckdb package (pip install duckdb)")
+        self.path = path
+        # With upsert=False, rows whose key is already stored are ignored instead of updated
+        self.upsert = upsert
+        self._conn = duckdb.connect(path)
+        self._lock = threading.RLock()
+        self._writes = 0
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        """Create every table the ingest and the chatbot use, keyed like their PostgreSQL counterparts."""
+        with self._lock:
+            for table in COLLECTION_TABLES:
+                columns = [f"{_quote(column)} {duckdb_type(COLUMN_TYPES[table.name][column])}" for column in table.columns]
+                columns.append(f"UNIQUE ({', '.join(map(_quote, table.conflict_columns))})")
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table.name)} ({', '.join(columns)})")
+            for statement in DUCKDB_DDL:
+                self._conn.execute(statement)
+            # Files created before FLOAT was mapped to DOUBLE hold 4-byte REAL columns
+            narrow = self._conn.execute(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND data_type = 'FLOAT'"
+            ).fetchall()
+            for table_name, column in narrow:
+                self._conn.execute(f"ALTER TABLE {_quote(table_name)} ALTER {_quote(column)} TYPE DOUBLE")
+
+    @contextmanager
+    def connection(self):
+        """Yield a connection for one unit of work, committed when the block exits cleanly."""
+        with self._lock:
+            self._conn.execute("BEGIN TRANSACTION")
+            try:
+                yield DuckDBConnection(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @contextmanager
+    def run(self):
+        """Each unit of work commits on its own; DuckDB has no savepoints to isolate a failed page within a run."""
+        yield self
+
+    def _insert_sql(self, table, row_count):
+        columns = ", ".join(map(_quote, table.columns))
+        row = "(" + ", ".join("?" * len(table.columns)) + ")"
+        keys = ", ".join(map(_quote, table.conflict_columns))
+        statement = f"INSERT INTO {_quote(table.name)} ({columns}) VALUES {', '.join([row] * row_count)} "
+        if not self.upsert:
+            return statement + f"ON CONFLICT ({keys}) DO NOTHING"
+        updates = ", ".join(
+            f"{_quote(column)} = EXCLUDED.{_quote(column)}"
+            for column in table.columns if column not in table.conflict_columns
+        )
+        statement += f"ON CONFLICT ({keys}) DO UPDATE SET {updates}"
+        if table.version_column:
+            version = _quote(table.version_column)
+            statement += f" WHERE EXCLUDED.{version} >= {_quote(table.name)}.{version}"
+        return statement
+
+    def store_records(self, bulk_writer, flattener, records, user_id):
+        """
+        Flatten and upsert a page of API records in statements of bulk_writer.page_size rows.
+        A statement that fails is retried one row at a time, and the rows that still fail
+        go to dead_letter_records. Returns the rows written.
+        """
+        table = flattener.table
+        rows, kept, rejected = flatten_isolated(flattener, records, user_id)
+        # Keep the last row per key; one statement cannot update the same row twice
+        latest = {}
+        for row, record in zip(rows, kept):
+            latest[table.key_of(row)] = (row, record)
+        pairs = list(latest.values())
+
+        written = []
+        started = time.perf_counter()
+        with self._lock:
+            for offset in range(0, len(pairs), bulk_writer.page_size):
+                chunk = pairs[offset:offset + bulk_writer.page_size]
+                try:
+                    self._conn.execute(
+                        self._insert_sql(table, len(chunk)), [value for row, _ in chunk for value in row]
+                    )
+                    written.extend(row for row, _ in chunk)
+                    continue
+                except duckdb.Error:
+                    pass
+                for row, record in chunk:
+                    try:
+                        self._conn.execute(self._insert_sql(table, 1), list(row))
+                        written.append(row)
+                    except duckdb.Error as e:
+                        rejected.append((record, f"{type(e).__name__}: {str(e).strip().splitlines()[0]}"))
+            self._writes += 1
+            if rejected:
+                with self.connection() as conn:
+                    dead_letter(conn, table, user_id, rejected, bulk_writer.metrics)
+
+        if bulk_writer.metrics is not None:
+            bulk_writer.metrics.record_write({
+                "table": table.name, "mode": "duckdb", "rows": len(written),
+                "skipped_unchanged": 0, "seconds": time.perf_counter() - started,
+            })
+        return written
+
+    def query(self, statement, params=None):
+        """Run a read query in-process. Returns (column names, rows)."""
+        with self._lock:
+            result = self._conn.execute(duckdb_statement(statement), params)
+            return [column[0] for column in result.description], result.fetchall()
+
+    def stats(self):
+        return {"backend": "duckdb", "path": self.path, "writes": self._writes}
+
+    def close(self):
+        self._conn.close()
+
+
+def storage_for(db):
+    """The storage backend behind a store_* db argument: a backend itself, or PostgreSQL for pools, runs and configs."""
+    return db if hasattr(db, "store_records") else PostgresStorage(db)
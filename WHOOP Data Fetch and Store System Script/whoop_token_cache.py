@@ -0,0 +1,57 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+
+class TokenCache:
+    """
+    Keeps each account's OAuth token (user_id included) in a file only the owner can read.
+
+    One JSON file per account under `directory`, named after a hash of the username.
+    Files are created with 0600 permissions and replaced atomically on every save.
+    """
+
+    EXPIRY_LEEWAY = 60  # Treat tokens as expired this many seconds early
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, username):
+        digest = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"token_{digest}.json")
+
+    def load(self, username):
+        """Return the cached token for an account, or None."""
+        try:
+            with open(self._path(username), "r", encoding="utf-8") as token_file:
+                return json.load(token_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, username, token):
+        """Persist a token for an account with owner-only permissions."""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self._path(username)
+        temp_path = f"{path}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as token_file:
+            json.dump(dict(token), token_file)
+        os.replace(temp_path, path)
+        logging.info("Cached WHOOP token saved.")
+
+    def clear(self, username):
+        """Forget an account's token, e.g. after it was rejected."""
+        try:
+            os.remove(self._path(username))
+        except OSError:
+            pass
+
+    @classmethod
+    def is_valid(cls, token):
+        """True when the token has an access token that has not expired yet."""
+        if not token or not token.get("access_token"):
+            return False
+        expires_at = token.get("expires_at")
+        return expires_at is None or expires_at - cls.EXPIRY_LEEWAY > time.time()
@@ -0,0 +1,146 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import timedelta
+
+import requests
+from psycopg2 import sql
+
+from whoop_db import CYCLE_DATA, RECOVERY_DATA, SLEEP_DATA, WORKOUT_DATA, borrow_connection
+from whoop_pipeline import STORE_METHODS
+from whoop_records import FLATTENERS
+from whoop_rollup import days_of, refresh_daily_summary
+from whoop_sync import parse_timestamp
+
+SIGNATURE_HEADER = "X-WHOOP-Signature"
+TIMESTAMP_HEADER = "X-WHOOP-Signature-Timestamp"
+
+# Event type prefix -> (collection, table, column matched against the event id on deletes).
+# Recovery events carry the id of the sleep the recovery belongs to.
+EVENT_TYPES = {
+    "cycle": ("cycle", CYCLE_DATA, "cycle_id"),
+    "recovery": ("recovery", RECOVERY_DATA, "sleep_id"),
+    "sleep": ("sleep", SLEEP_DATA, "sleep_id"),
+    "workout": ("workout", WORKOUT_DATA, "workout_id"),
+}
+EVENT_ACTIONS = ("updated", "deleted")
+
+
+def sign_payload(secret, body, timestamp):
+    """base64(HMAC-SHA256(timestamp + body, secret)), the signature WHOOP sends with each event."""
+    message = str(timestamp).encode("utf-8") + body
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()).decode("ascii")
+
+
+def verify_signature(secret, body, timestamp, signature, tolerance_seconds=300):
+    """True when the signature matches and the millisecond timestamp is recent enough to rule out replays."""
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        age = abs(time.time() - int(timestamp) / 1000)
+    except ValueError:
+        return False
+    if age > tolerance_seconds:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body, timestamp), signature)
+
+
+def parse_event(payload):
+    """Validate a webhook body such as {"user_id": 10129, "id": 123, "type": "sleep.updated"}."""
+    if not isinstance(payload, dict):
+        raise ValueError("Event body must be a JSON object")
+    kind, _, action = str(payload.get("type", "")).partition(".")
+    if kind not in EVENT_TYPES or action not in EVENT_ACTIONS:
+        raise ValueError(f"Unsupported event type: {payload.get('type')}")
+    if payload.get("id") in (None, "") or payload.get("user_id") in (None, ""):
+        raise ValueError("Event is missing its id or user_id")
+    return {
+        "type": payload["type"],
+        "kind": kind,
+        "action": action,
+        "id": payload["id"],
+        "user_id": payload["user_id"],
+        "trace_id": payload.get("trace_id"),
+    }
+
+
+def _get_record(client, collection, record_id):
+    """get_record, archiving the response like iter_pages archives the pages it fetches."""
+    record = client.get_record(collection, record_id)
+    if client.raw_archive is not None:
+        client.raw_archive.append(client.user_id, client.COLLECTION_ENDPOINTS[collection], [record])
+    return record
+
+
+def fetch_event_records(client, kind, record_id):
+    """Fetch the record an event names; a recovery is found through the sleep it belongs to."""
+    if kind != "recovery":
+        return [_get_record(client, kind, record_id)]
+    sleep = _get_record(client, "sleep", record_id)
+    start = parse_timestamp(sleep["start"]) - timedelta(days=1)
+    end = parse_timestamp(sleep.get("end") or sleep["start"]) + timedelta(days=1)
+    return [
+        record
+        for page in client.iter_collection_pages("recovery", start, end)
+        for record in page
+        if str(record.get("sleep_id")) == str(record_id)
+    ]
+
+
+def _delete_record(store_db, table, key_column, user_id, record_id):
+    """Delete the rows an event names. Returns the days they belonged to."""
+    with borrow_connection(store_db) as conn, conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DELETE FROM {} WHERE user_id = %s AND {} = %s RETURNING {}").format(
+            sql.Identifier(table.name), sql.Identifier(key_column), sql.Identifier(table.time_column)
+        ), (str(user_id), str(record_id)))
+        return {row[0].date() for row in cursor.fetchall() if row[0] is not None}
+
+
+def handle_event(client, store_db, event):
+    """
+    Apply one webhook event for the client's account: fetch and upsert the single record
+    it names, or delete it, then refresh the daily rollup for the affected days.
+    """
+    collection, table, key_column = EVENT_TYPES[event["kind"]]
+    if event["action"] == "deleted":
+        days = _delete_record(store_db, table, key_column, client.user_id, event["id"])
+        records = []
+    else:
+        records = fetch_event_records(client, collection, event["id"])
+        if records:
+            if getattr(client, STORE_METHODS[collection])(records, store_db) is False:
+                raise RuntimeError(f"Storing {event['type']} {event['id']} failed")
+        days = days_of(table, FLATTENERS[collection].rows(records, client.user_id))
+
+    refresh_daily_summary(store_db, client.user_id, days)
+    logging.info(f"Applied webhook {event['type']} {event['id']} for user {client.user_id}")
+    return {"event": event["type"], "id": event["id"], "records": len(records), "days": sorted(map(str, days))}
+
+
+def send_event(url, secret, event_type, record_id, user_id, trace_id=None):
+    """Sign and POST an event like WHOOP does; handy for exercising the receiver locally."""
+    body = json.dumps({"user_id": user_id, "id": record_id, "type": event_type, "trace_id": trace_id}).encode("utf-8")
+    timestamp = str(int(time.time() * 1000))
+    headers = {
+        "Content-Type": "application/json",
+        SIGNATURE_HEADER: sign_payload(secret, body, timestamp),
+        TIMESTAMP_HEADER: timestamp,
+    }
+    return requests.post(url, data=body, headers=headers, timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a signed WHOOP-style webhook event to a local receiver.")
+    parser.add_argument("--url", default="http://localhost:8080/webhooks/whoop")
+    parser.add_argument("--secret", required=True, help="the WHOOP_WEBHOOK_SECRET the receiver verifies with")
+    parser.add_argument("--type", required=True, help="e.g. sleep.updated, workout.deleted, recovery.updated")
+    parser.add_argument("--id", required=True, help="id of the record the event is about")
+    parser.add_argument("--user-id", required=True, type=int)
+    args = parser.parse_args()
+
+    response = send_event(args.url, args.secret, args.type, args.id, args.user_id, trace_id="local-sender")
+    print(response.status_code, response.text)